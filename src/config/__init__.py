@@ -45,7 +45,8 @@ def get_config(section: str, p_name: str = None, default_value=None):
         else:
             config_data = None
 
-    return config_data if config_data else default_value
+    # A configured 0/false/"" is a value too; only a missing key falls back
+    return config_data if config_data is not None else default_value
 
 
 # --------------------------------------- get_enabled_commands ---------------------------------------
@@ -72,6 +73,17 @@ def get_supported_formats():
 # f_handler.setFormatter(l_formatter)
 
 
+# --------------------------------------- _StdoutProxy ---------------------------------------
+# - Looks up sys.stdout on every write so log lines follow rich's live-display
+#   redirection and print above the progress bars instead of through them
+class _StdoutProxy:
+    def write(self, text):
+        return sys.stdout.write(text)
+
+    def flush(self):
+        sys.stdout.flush()
+
+
 # --------------------------------------- get_logger ---------------------------------------
 # - Create a logger with colored output
 def get_logger(name):
@@ -84,7 +96,7 @@ def get_logger(name):
 
     # Create and configure colored stream handler
     color_formatter = ColorFormatter("%(levelname)s: %(message)s")
-    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler = logging.StreamHandler(_StdoutProxy())
     stream_handler.setFormatter(color_formatter)
 
     # Add the colored handler
@@ -1,177 +1,335 @@
-import pandas as pd
+import os
+import secrets
+import shutil
+import threading
+import time
+
 from openpyxl import Workbook, load_workbook
-from openpyxl.utils.dataframe import dataframe_to_rows
+from openpyxl.styles import PatternFill
+
+from src.config import get_config, get_logger
+
+logger = get_logger(__name__)
+
+RED_FILL = PatternFill(start_color="FFCCCC", end_color="FFCCCC", fill_type="solid")
 
 # ----------------------------------------------------------------------------------------------------
-# INACTIVE - ExcelWorkbookController.py
-# - A class to handle Excel workbook operations, including loading, saving, and manipulating sheets.
-# - It uses the openpyxl library to manage Excel files and pandas for DataFrame operations.
-# - The class provides methods to initialize a workbook, add DataFrames to sheets, reset sheets, and highlight rows based on conditions.
-# - It also includes a method to list all sheets in the workbook.
+# ExcelWorkbookController.py
+# - One session on an Excel workbook: it is loaded once, on first use, and every read and change
+#   after that works on the copy in memory.
+# - Changes are written back by `save_workbook` (a checkpoint) and once more when the session closes,
+#   so a run touching the same file many times costs one load and a save per checkpoint.
+# - Saves never write over the file in place: the workbook goes to a temp file next to it, which
+#   replaces it once fully on disk, so a kill mid-save leaves the previous version intact.
+# - Use it as a context manager; the final save runs on errors and Ctrl-C too.
 #
 # ----------------------------------------------------------------------------------------------------
 
 
 class ExcelWorkbookController:
-    def __init__(self, file_path):
+    def __init__(self, file_path, new=False, read_only=False, save_window=None, on_save=None):
         """
-        Initialize the ExcelHandler object.
+        Open a session on an Excel workbook. Nothing is read until it is first used.
 
         Parameters:
-        file_path (str): The path to the Excel file.
+        file_path (str): The path to the Excel file; created on save if it doesn't exist.
+        new (bool): Start from an empty workbook, replacing the file on save.
+        read_only (bool): Never write the file back; changes stay in memory.
+        save_window (float): Seconds within which saves are coalesced (`[workbook]` in config.toml).
+        on_save (callable): Called as on_save(seconds, size) after each save with its duration and bytes written.
         """
         self.file_path = file_path
+        self.new = new
+        self.read_only = read_only
+        self.save_window = save_window if save_window is not None else get_config("workbook", "save_window", 2)
+        self.on_save = on_save
         self.workbook = None
+        self.dirty = False
+        self._url_rows = {}  # sheet name -> {url: row number}
+        self._lock = threading.RLock()
+        self._last_save = float("-inf")
+        self._timer = None
+        self._on_saved = []  # callbacks waiting for the next save
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
     def initialize_workbook(self):
         """
-        Load the workbook from the file path. If the file does not exist, create a new workbook.
+        Load the workbook from the file path, or create an empty one if there is no file yet.
         """
+        with self._lock:
+            if self.workbook is not None:
+                return self.workbook
+            if not self.new and os.path.exists(self.file_path):
+                self.workbook = load_workbook(self.file_path)
+            else:
+                self.workbook = Workbook()
+                self.workbook.remove(self.workbook.active)
+                self.dirty = True
+            return self.workbook
+
+    def save_workbook(self, force=False, on_saved=None):
+        """
+        Write the workbook to its file if anything changed since the last save.
+
+        A save asked for within `save_window` seconds of the previous one is
+        deferred to the end of the window and made once for every request in
+        between, unless `force`. `on_saved(seconds, size)` is called once the
+        changes so far are on disk, now or after the deferred save.
+
+        Returns (seconds, size) if it saved now, else None.
+        """
+        with self._lock:
+            if on_saved:
+                self._on_saved.append(on_saved)
+            if self.read_only:
+                return None
+            wait = self._last_save + self.save_window - time.monotonic()
+            if wait > 0 and not force:
+                if self._timer is None:
+                    self._timer = threading.Timer(wait, self._deferred_save)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return None
+            return self._save()
+
+    def _deferred_save(self):
         try:
-            self.workbook = load_workbook(self.file_path)
+            self._save()
+        except Exception as e:
+            logger.error(f"Could not save {self.file_path}: {e}")
 
-            print(f"Workbook '{self.file_path}' initialized.")
-        except FileNotFoundError:
-            self.workbook = Workbook()
-            self.workbook.remove(self.workbook.active)
-            print(f"File not found. Created a new workbook.")
+    def _save(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            result = None
+            if self.dirty:
+                started = time.perf_counter()
+                size = _atomic_save(self.workbook, self.file_path)
+                self.dirty = False
+                self._last_save = time.monotonic()
+                result = (time.perf_counter() - started, size)
+                logger.debug(f"Saved {self.file_path} ({size / 1e6:.1f} MB in {result[0]:.2f}s)")
+                if self.on_save:
+                    self.on_save(*result)
+            callbacks, self._on_saved = self._on_saved, []
+        for callback in callbacks:
+            callback(*(result or (0.0, 0)))
+        return result
 
-    def get_workbook(self):
+    def close(self):
         """
-        Reads the workbook from the file path and creates a pandas dataframe of it
+        Save what is left now; an error is logged rather than raised, like a failed checkpoint.
         """
         try:
-            # self.workbook = load_workbook(self.file_path)
-            xls = pd.ExcelFile(self.file_path)
-            print(f"Workbook dataframe acquired.")
-            return xls
-        except FileNotFoundError:
-            print(f"File not found")
+            self.save_workbook(force=True)
+        except Exception as e:
+            logger.error(f"Could not save {self.file_path}: {e}")
 
-    def save_workbook(self):
+    def list_sheets(self):
         """
-        Save the workbook to the specified file path.
+        List all sheet names in the workbook.
         """
-        if not self.workbook:
-            raise Exception(
-                "No workbook loaded or created. Call load_workbook() first."
-            )
-        self.workbook.save(self.file_path)
-        print(f"Workbook saved as '{self.file_path}'.")
+        return self.initialize_workbook().sheetnames
 
-    def reset_sheet(self, sheet_name):
+    def reset_sheet(self, sheet_name, columns=None):
         """
-        Resets a sheet by removing it and creating a new one with the same name.
-
-        Parameters:
-        sheet_name (str): Name of the sheet to reset.
+        Replace a sheet with an empty one of the same name (at the same position), headed by `columns`.
         """
-        if not self.workbook:
-            print("No workbook loaded. Call 'load_workbook' first.")
-            return
-
-        if sheet_name in self.workbook.sheetnames:
-            # Remove the existing sheet
-            del self.workbook[sheet_name]
-            print(f"Sheet '{sheet_name}' has been reset.")
+        with self._lock:
+            wb = self.initialize_workbook()
+            index = None
+            if sheet_name in wb.sheetnames:
+                index = wb.sheetnames.index(sheet_name)
+                del wb[sheet_name]
+            ws = wb.create_sheet(sheet_name, index)
+            if columns:
+                ws.append(list(columns))
+            self._url_rows.pop(sheet_name, None)
+            self.dirty = True
+            return ws
 
-        # Create a new, empty sheet with the same name
-        self.workbook.create_sheet(sheet_name)
-        print(f"New empty sheet '{sheet_name}' created.")
-
-    def add_df_to_workbook(self, df, sheet_name):
+    def read_rows(self, sheet_name, columns):
+        """
+        Values of the `columns` headers (any case) for each row of a sheet, as a list of tuples.
+        Empty if the sheet is missing; a missing column reads as None.
         """
-        Adds a DataFrame to a workbook sheet. Creates the sheet if it doesn't exist
-        and ensures the headers match the expected format.
+        with self._lock:
+            wb = self.initialize_workbook()
+            if sheet_name not in wb.sheetnames:
+                return []
+            ws = wb[sheet_name]
+            header = [str(c or "").strip().lower() for c in next(ws.iter_rows(max_row=1, values_only=True), ())]
+            positions = [header.index(c.lower()) if c.lower() in header else None for c in columns]
+            return [
+                tuple(row[p] if p is not None and p < len(row) else None for p in positions)
+                for row in ws.iter_rows(min_row=2, values_only=True)
+            ]
 
-        Parameters:
-        df (pd.DataFrame): DataFrame containing the data to add.
-        sheet_name (str): Name of the sheet to add the data to.
+    def append_rows(self, sheet_name, columns, rows):
         """
-        if not self.workbook:
-            print("No workbook loaded. Call 'load_workbook' first.")
+        Append `rows` (ordered as `columns`) under the matching headers of a sheet,
+        creating the sheet, or any header missing from it, if needed.
+        """
+        if not rows:
             return
+        with self._lock:
+            ws, positions = self._columns(sheet_name, columns)
+            url_rows = self._url_rows.get(sheet_name)
+            url_position = positions[columns.index("URL")] if "URL" in columns else None
+            for row in rows:
+                out = [None] * (max(positions) + 1)
+                for value, pos in zip(row, positions):
+                    out[pos] = value
+                ws.append(out)
+                # Keep a URL index already built for this sheet in step
+                if url_rows is not None and url_position is not None:
+                    url_rows.setdefault(out[url_position], ws.max_row)
+            self.dirty = True
 
-        print(f"Adding data to sheet: {sheet_name}")
-        try:
-            if df.empty:
-                print(f"DataFrame is empty. No data added to sheet '{sheet_name}'.")
-                return
-
-            # Check if the sheet exists; if not, create it
-            if sheet_name in self.workbook.sheetnames:
-                sheet = self.workbook[sheet_name]
-                print(f"Sheet '{sheet_name}' exists. Appending data.")
-            else:
-                sheet = self.workbook.create_sheet(sheet_name)
-                print(f"Created new sheet: {sheet_name}.")
+    def find_row(self, sheet_name, url, columns):
+        """
+        Values of the `columns` headers in the row of `url` (found through the sheet's URL index),
+        or None if the sheet has no such row; a missing column reads as None.
+        """
+        with self._lock:
+            row_number = self.url_rows(sheet_name).get(url)
+            if row_number is None:
+                return None
+            ws = self.workbook[sheet_name]
+            header = [str(c or "").strip().lower() for c in next(ws.iter_rows(max_row=1, values_only=True), ())]
+            return tuple(
+                ws.cell(row=row_number, column=header.index(c.lower()) + 1).value if c.lower() in header else None
+                for c in columns
+            )
 
-            # Append DataFrame rows to the sheet
-            rows_before = sheet.max_row
-            for row in dataframe_to_rows(df, index=False, header=True):
-                sheet.append(row)
-            rows_added = sheet.max_row - rows_before
-            print(f"Added {rows_added} rows to sheet '{sheet_name}'.")
+    def update_row(self, sheet_name, columns, values):
+        """
+        Overwrite the row with the same URL as `values` (ordered as `columns`, which include "URL")
+        in place, or append it if the sheet has none.
+        """
+        with self._lock:
+            row_number = self.url_rows(sheet_name).get(values[columns.index("URL")])
+            if row_number is None:
+                self.append_rows(sheet_name, columns, [values])
+                return
+            ws, positions = self._columns(sheet_name, columns)
+            for value, pos in zip(values, positions):
+                ws.cell(row=row_number, column=pos + 1, value=value)
+            self.dirty = True
 
-        except Exception as e:
-            print(f"Error adding data to sheet '{sheet_name}': {e}")
+    def _columns(self, sheet_name, columns):
+        # The sheet (created if missing) and the 0-based position of each of
+        # `columns` in it, adding headers it lacks at the end of the header row
+        wb = self.initialize_workbook()
+        ws = wb[sheet_name] if sheet_name in wb.sheetnames else self.reset_sheet(sheet_name, columns)
+        header = [str(c or "").strip() for c in next(ws.iter_rows(max_row=1, values_only=True), ())]
+        while header and not header[-1]:
+            header.pop()
+        for name in columns:
+            if name not in header:
+                header.append(name)
+                ws.cell(row=1, column=len(header), value=name)
+                self.dirty = True
+        return ws, [header.index(c) for c in columns]
 
-    def list_sheets(self):
+    def add_records(self, sheet_name, records):
         """
-        List all sheet names in the workbook.
+        Write dict rows into a fresh sheet; columns are every key, in order of first appearance.
+        """
+        columns = list(dict.fromkeys(key for record in records for key in record))
+        ws = self.reset_sheet(sheet_name, columns)
+        for record in records:
+            ws.append([record.get(column) for column in columns])
 
-        Returns:
-        list: A list of sheet names.
+    def url_rows(self, sheet_name):
         """
-        if not self.workbook:
-            raise Exception(
-                "No workbook loaded or created. Call load_workbook() first."
-            )
-        return self.workbook.sheetnames
-
-    def highlight_rows(self, row):
-        # If update type is a withdrawal, color it a light red
-        if row["Update Type"] == "W":
-            return ["background-color: #FFC7CE"] * len(row)
-        if row["Update Type"] == "N":
-            return ["background-color: #C6EFCE"] * len(row)
-        else:
-            return [""] * len(row)
-
-    def highlight_row(row):
-        print(row)
-        if row.Name != "Name":
-            print("row.Name")
-            if row.Count < 40:
-                return pd.Series("background-color: red", row.index)
-            else:
-                return pd.Series("background-color: green", row.index)
-        else:
-            return pd.Series("", row.index)
+        {url: row number} for a sheet's URL column (first row per URL), built once per session.
+        """
+        with self._lock:
+            if sheet_name not in self._url_rows:
+                wb = self.initialize_workbook()
+                index = {}
+                url_col = _find_url_column(wb[sheet_name]) if sheet_name in wb.sheetnames else None
+                if url_col is not None:
+                    for row_number, (url,) in enumerate(
+                        wb[sheet_name].iter_rows(min_row=2, min_col=url_col, max_col=url_col, values_only=True),
+                        start=2,
+                    ):
+                        if url is not None:
+                            index.setdefault(url, row_number)
+                self._url_rows[sheet_name] = index
+            return self._url_rows[sheet_name]
 
+    def set_url_rows(self, sheet_name, index):
+        """
+        Use `index` ({url: row number}, e.g. collected while the sheet was streamed) as the
+        sheet's URL index instead of scanning the sheet for it; it may still be growing.
+        """
+        with self._lock:
+            self._url_rows[sheet_name] = index
 
-if __name__ == "__main__":
-    # An example DataFrame
-    data = {
-        "Name": ["Alice", "Bob", "Charlie"],
-        "Age": [25, 30, 35],
-        "Update Type": ["N", "W", "R"],
-        "City": ["New York", "San Francisco", "Los Angeles"],
-    }
-    df = pd.DataFrame(data)
+    def highlight_urls(self, sheet_name, urls, fill=RED_FILL):
+        """
+        Color the rows of a sheet whose URL is in `urls`, looked up in its URL index rather than
+        by scanning; returns how many were found.
+        """
+        with self._lock:
+            index = self.url_rows(sheet_name)
+            row_numbers = [index[url] for url in urls if url in index]
+            if not row_numbers:
+                return 0
+            ws = self.initialize_workbook()[sheet_name]
+            for row_number in row_numbers:
+                for cell in ws[row_number]:
+                    cell.fill = fill
+            self.dirty = True
+            return len(row_numbers)
 
-    # Initialize ExcelHandler with the file path
-    excel_handler = ExcelWorkbookController("example.xlsx")
 
-    # Load or create the workbook
-    excel_handler.initialize_workbook()
-    df.style.apply(excel_handler.highlight_row, axis=1)
+def _find_url_column(ws):
+    """1-based index of the `URL` header cell in `ws`, or None."""
+    header = next(ws.iter_rows(min_row=1, max_row=1), ())
+    return next(
+        (cell.column for cell in header if str(cell.value or "").strip().lower() == "url"),
+        None,
+    )
 
-    # Add the DataFrame to a new sheet
-    excel_handler.add_df_to_workbook(df, sheet_name="Sheet1")
 
-    # Save the workbook
-    excel_handler.save_workbook()
+def _atomic_save(workbook, file_path):
+    """Save to a temp file beside `file_path`, fsync it and rename it over the original; returns the size."""
+    directory = os.path.dirname(os.path.abspath(file_path))
+    temp_path = os.path.join(directory, f".{os.path.basename(file_path)}.{secrets.token_hex(4)}.tmp")
+    # Unlike mkstemp's 0600, the umask applies, so a new workbook gets the usual mode
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o666)
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            workbook.save(fp)
+            fp.flush()
+            os.fsync(fp.fileno())
+        if os.path.exists(file_path):
+            shutil.copymode(file_path, temp_path)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
 
-    # List all sheets
-    print("Available sheets:", excel_handler.list_sheets())
+    # Make the rename itself durable; directories can't be opened on Windows
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    except OSError:
+        pass
+    return os.path.getsize(file_path)
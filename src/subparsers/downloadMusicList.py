@@ -1,20 +1,37 @@
+import csv
+import itertools
 import os
 import re
-import pandas as pd  # type: ignore
-import yt_dlp
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+
+from rich.console import Console
+from rich.markup import escape
+from rich.table import Table
 
 # Utils
-from src.utils.ytDownloader import download_file, YtDlpLogger, _JS_RUNTIME
-from src.utils.xlsx import (
-    append_to_past_downloads,
-    append_to_failed_downloads,
-    deduplicate_failed_downloads,
-    is_already_downloaded,
-    mark_url_red,
+from src.utils.fuzzyIndex import FuzzyIndex
+from src.utils.infoCache import CACHED_KEY, InfoCache
+from src.utils.journal import JobJournal
+from src.utils.libraryIndex import LibraryIndex
+from src.utils.rateLimiter import RateLimiter
+from src.utils.timings import TimingReport
+from src.utils.workQueue import WorkQueue, classify_error
+from src.utils.ytDownloader import (
+    DownloadSession,
+    PostProcessPool,
+    is_playlist_url,
+    RunProgress,
+    remove_partial_files,
 )
-from src.utils.metadata import clean_keywords
+from src.utils.listFiles import list_format, read_list
+from src.utils.ledger import DB_EXTENSIONS, default_ledger_path, open_ledger
+from src.utils.xlsx import sheet_names
+from src.utils.metadata import clean_keywords, normalize_track_key
 
-from src.config import get_logger
+from src.config import get_config, get_logger
 
 logger = get_logger(__name__)
 
@@ -42,37 +59,580 @@ def _parse_source(url: str) -> str:
     return domain.split(".")[0].capitalize()
 
 
+# Makes the skip checks and the claim on an output path one atomic step across
+# workers; the ledger does its own locking
+_ledger_lock = threading.Lock()
+
+
+# --------------------------------------- _DownloadRun ---------------------------------------
+# - State shared by every row of one download_music_from_xlsx run
+class _DownloadRun:
+    def __init__(self, file, output_dir, library, fuzzy, ledger, cache, journal, pp_pool,
+                 refresh_metadata=False, timings=None, url_rows=None, skip_failed_after=0):
+        self.file = file
+        self.output_dir = output_dir
+        self.library = library
+        self.fuzzy = fuzzy
+        self.ledger = ledger
+        self.cache = cache
+        self.journal = journal
+        self.pp_pool = pp_pool
+        self.refresh_metadata = refresh_metadata
+        self.timings = timings
+        # URL -> row number in the list sheet, filled as the list is read, so
+        # failed rows can be colored without scanning the sheet again
+        self.url_rows = url_rows
+        # URLs that failed permanently in this many runs aren't tried again (0: always try)
+        self.skip_failed_after = skip_failed_after
+        # Normalized (artist, title) keys already taken in this run, so two
+        # workers never download the same track at once
+        self.claimed = set()
+        # (url, artist, title, FuzzyMatch) for every probable duplicate skipped
+        self.duplicates = []
+        # Paces network requests per source across all workers
+        self.limiter = RateLimiter(_parse_source)
+        # Round-robin position per source for [fragments] lists
+        self._fragment_turns = defaultdict(itertools.count)
+        self.progress = None
+        # WorkQueue of the run; transient failures are put back on it
+        self.queue = None
+        self._local = threading.local()
+        self._sessions = []
+
+    def session(self):
+        """The calling worker's DownloadSession, created on first use."""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = DownloadSession(
+                cache=self.cache, refresh=self.refresh_metadata,
+                pp_pool=self.pp_pool, limiter=self.limiter,
+            )
+            with _ledger_lock:
+                self._sessions.append(session)
+        return session
+
+    def record_timing(self, stage, seconds, url="", source="", **fields):
+        if self.timings is not None:
+            self.timings.record(stage, seconds, url, source, **fields)
+
+    def extract(self, url, source):
+        """The calling worker's session.extract, timed as extract_info or cache_lookup."""
+        started = time.perf_counter()
+        info_dict = self.session().extract(url)
+        stage = "cache_lookup" if info_dict.get(CACHED_KEY) else "extract_info"
+        self.record_timing(stage, time.perf_counter() - started, url, source)
+        return info_dict
+
+    def fragments(self, source):
+        """Concurrent fragment downloads for the next track from `source`, per [fragments]."""
+        setting = get_config("fragments", source) or get_config("fragments", "default", 1)
+        if isinstance(setting, list):
+            setting = setting[next(self._fragment_turns[source]) % len(setting)]
+        return max(1, int(setting))
+
+    def track_done(self):
+        """Count a URL as finished (skipped, failed or ledgered) on the overall bar."""
+        if self.progress is not None:
+            self.progress.track_done()
+
+    def close(self):
+        for session in self._sessions:
+            session.close()
+        self.cache.close()
+
+
+# --------------------------------------- _track_names ---------------------------------------
+# - Work out (title, artist_name, cleaned_title, cleaned_artist_name) from an info dict
+def _track_names(info_dict):
+    title_raw = (
+        info_dict.get("title", "Unknown Title").strip().replace("/", "-")
+    )
+    title = (
+        title_raw.split("-", 1)[-1].strip()
+        if "-" in title_raw
+        else title_raw
+    )
+
+    uploader = (
+        info_dict.get("uploader", "Unknown Uploader")
+        .strip()
+        .replace("/", "-")
+    )
+
+    # Use semantic metadata if available
+    track = info_dict.get("track")
+    artist = info_dict.get("artist")
+    if "-" in title_raw:
+        parts = title_raw.split("-", 1)
+        artist_name = parts[0].strip().replace("/", "-")
+        title = parts[1].strip().replace("/", "-")
+    elif track and artist:
+        title = track.strip().replace("/", "-")
+        artist_name = artist.strip().replace("/", "-")
+    else:
+        title = title_raw
+        artist_name = uploader
+
+    # Clean up both artist and title using the shared keyword cleaner
+    return title, artist_name, clean_keywords(title), clean_keywords(artist_name)
+
+
+# --------------------------------------- _download_row ---------------------------------------
+# - Extract, dedupe, download and ledger a single URL from the list
+# - With --resume, stages finished by an interrupted run (per the journal) are
+#   not repeated
+# - Rows that failed for a transient reason (rate limiting, timeouts, 5xx) go
+#   back on the run's queue for a later attempt rather than being recorded as failed
+def _download_row(url, run, attempt=1):
+    name = url  # fallback if metadata extraction fails
+    source = _parse_source(url)
+    journal = run.journal
+    prior = journal.previous(url) or {}
+    stage = prior.get("stage")
+    outtmpl = None
+    key = None
+    claimed = False  # whether this row holds the claim on its track
+
+    if stage in JobJournal.DONE:
+        logger.info(f"Finished in a previous run ({stage}), skipping: {url}")
+        run.track_done()
+        return
+
+    try:
+        session = run.session()
+        info_dict = None
+        if stage in (JobJournal.EXTRACTED, JobJournal.DOWNLOADED, JobJournal.POSTPROCESSED):
+            # Names were settled before the interruption; no need to extract again
+            title, artist_name = prior["title"], prior["artist"]
+            cleaned_title, cleaned_artist_name = prior["clean_title"], prior["clean_artist"]
+        else:
+            # Extract metadata once (or read it from the on-disk cache); the
+            # same info dict is reused for the download
+            info_dict = run.extract(url, source)
+            title, artist_name, cleaned_title, cleaned_artist_name = _track_names(info_dict)
+            journal.record(
+                url, JobJournal.EXTRACTED,
+                title=title, artist=artist_name,
+                clean_title=cleaned_title, clean_artist=cleaned_artist_name,
+            )
+
+        # Set the base name for the file
+        base_name = f"{cleaned_artist_name} - {cleaned_title}.m4a"
+        full_path = os.path.join(run.output_dir, base_name) if run.output_dir else base_name
+
+        # Create filename template to output with yt-dlp
+        outtmpl = full_path.replace(".m4a", ".%(ext)s")
+        name = os.path.basename(outtmpl).replace(".%(ext)s", "")
+        key = normalize_track_key(cleaned_artist_name, cleaned_title)
+
+        if stage == JobJournal.POSTPROCESSED and os.path.exists(full_path):
+            # Finished on disk last time but never made it into the ledger
+            with _ledger_lock:
+                if key in run.claimed:
+                    run.track_done()
+                    return
+                run.claimed.add(key)
+            logger.info(f"Recovered from previous run: {name}")
+            _ledger_download(run, url, title, artist_name)
+            run.track_done()
+            return
+
+        started = time.perf_counter()
+        with _ledger_lock:
+            # A raw file left by an interrupted run is this row's own download,
+            # not a duplicate
+            skip = _skip_reason(
+                run, key, cleaned_artist_name, cleaned_title,
+                resumed_download=stage == JobJournal.DOWNLOADED,
+            )
+        run.record_timing("skip_checks", time.perf_counter() - started, url, source)
+        if skip:
+            reason, detail = skip
+            if reason == "fuzzy":
+                logger.info(
+                    f"Probably a duplicate ({detail.score:.2f}), skipping: {name} "
+                    f"~ {detail.artist} - {detail.title} [{detail.source}]"
+                )
+                run.duplicates.append((url, cleaned_artist_name, cleaned_title, detail))
+                journal.record(url, JobJournal.SKIPPED, reason=reason, score=detail.score)
+            else:
+                logger.info(f"Already exists, skipping: {detail or name}")
+                journal.record(url, JobJournal.SKIPPED, reason=reason)
+            run.track_done()
+            return
+        claimed = True
+
+        # Leftovers of an interrupted download would be resumed or embedded as-is;
+        # a finished raw download is kept so only post-processing is redone
+        if stage is not None and stage != JobJournal.DOWNLOADED:
+            for path in remove_partial_files(outtmpl):
+                logger.info(f"Removed partial file: {path}")
+
+        # Download the file using yt-dlp
+        if info_dict is None:
+            info_dict = run.extract(url, source)
+        logger.info(f"Downloading > {name} | {source}")
+        logger.info(f"Saving to > {full_path}")
+        future = session.download(
+            info_dict,
+            outtmpl,
+            metadata={"title": cleaned_title, "artist": cleaned_artist_name},
+            progress=run.progress,
+            on_stage=lambda done: journal.record(url, done),
+            on_timing=lambda step, seconds, **fields: run.record_timing(step, seconds, url, source, **fields),
+            concurrent_fragments=run.fragments(source),
+        )
+    except Exception as e:
+        delay = None
+        if run.queue is not None and classify_error(e) == "transient":
+            delay = run.queue.retry(url, attempt)
+        if delay is not None:
+            reason = str(e).removeprefix("ERROR: ").strip()
+            logger.warning(
+                f"Transient error [{source}] {name}: {reason}; "
+                f"requeued for attempt {attempt + 1}/{run.queue.attempts} in {delay:.0f}s or later"
+            )
+            if outtmpl:
+                remove_partial_files(outtmpl)
+            if claimed:
+                # Let the retry claim the track again instead of matching its own claim
+                with _ledger_lock:
+                    run.claimed.discard(key)
+                    run.fuzzy.remove(cleaned_artist_name, cleaned_title, "this run")
+            return
+        _record_failure(run, url, e, source, name, outtmpl)
+        run.track_done()
+        return
+
+    # Post-processing may still be running in the pool; the worker moves on to
+    # the next URL and the track is ledgered once ffmpeg is done with it
+    def _postprocessed(future):
+        if future.cancelled():
+            return  # Ctrl-C; the journal still says "downloaded" for --resume
+        if future.exception():
+            _record_failure(run, url, future.exception(), source, name, outtmpl)
+        else:
+            run.library.add(future.result()["filepath"])
+            _ledger_download(run, url, title, artist_name)
+        run.track_done()
+
+    future.add_done_callback(_postprocessed)
+
+
+# --------------------------------------- _download_item ---------------------------------------
+# - Run one (url, attempt) of the run's WorkQueue and tell the queue it's done
+def _download_item(item, run):
+    url, attempt = item
+    try:
+        _download_row(url, run, attempt)
+    finally:
+        run.queue.done()
+
+
+# --------------------------------------- _skip_reason ---------------------------------------
+# - Why a track shouldn't be downloaded, as (reason, detail):
+#   ("exists", path on disk), ("duplicate", None) for a track already taken
+#   earlier in this run, ("pastDownloads", None) or ("fuzzy", FuzzyMatch)
+# - Returns None and claims the track for this run otherwise
+# - Call with _ledger_lock held
+def _skip_reason(run, key, artist, title, resumed_download=False):
+    existing = None if resumed_download else run.library.find(artist, title)
+    if existing:
+        return "exists", existing
+    if key in run.claimed:
+        return "duplicate", None
+    if run.ledger.contains(title, artist):
+        return "pastDownloads", None
+    # Near-duplicates: other mixes/spellings of a track we already have
+    match = None if resumed_download else run.fuzzy.match(artist, title)
+    if match:
+        return "fuzzy", match
+
+    run.claimed.add(key)
+    run.fuzzy.add(artist, title, "this run")
+    return None
+
+
+# --------------------------------------- _record_failure ---------------------------------------
+def _record_failure(run, url, error, source, name, outtmpl=None):
+    reason = str(error).removeprefix("ERROR: ").strip()
+    logger.error(f"Error [{source}] {name}: {reason}")
+    if outtmpl:
+        remove_partial_files(outtmpl)
+    # Queues the failedDownloads row and the red fill on the list sheet
+    run.ledger.add_failed_download(url, reason)
+
+
+# --------------------------------------- _ledger_download ---------------------------------------
+# - Record a finished track in pastDownloads; the journal marks it ledgered
+#   once the ledger has actually saved it
+def _ledger_download(run, url, title, artist_name):
+    run.ledger.add_past_download(url, title, artist_name)
+
+
+# --------------------------------------- _build_fuzzy_index ---------------------------------------
+def _build_fuzzy_index(ledger, library, threshold=None):
+    fuzzy = FuzzyIndex(threshold)
+    for title, uploader in ledger:
+        fuzzy.add(uploader, title, "pastDownloads")
+    for path in library.paths():
+        fuzzy.add(*library.split_name(path), path)
+    return fuzzy
+
+
+# --------------------------------------- _write_duplicates_report ---------------------------------------
+# - CSV next to the workbook listing each probable duplicate and what it matched
+def _write_duplicates_report(file, duplicates):
+    if not duplicates:
+        return
+    path = os.path.splitext(file)[0] + ".duplicates.csv"
+    with open(path, "w", newline="", encoding="utf-8") as fp:
+        writer = csv.writer(fp)
+        writer.writerow(["URL", "Artist", "Title", "Score", "Matched Artist", "Matched Title", "Matched In"])
+        for url, artist, title, match in duplicates:
+            writer.writerow([url, artist, title, match.score, match.artist, match.title, match.source])
+    logger.info(f"Skipped {len(duplicates)} probable duplicates, see {path}")
+
+
+# --------------------------------------- _iter_urls ---------------------------------------
+# - Yield the track URLs of the list, expanding playlists/sets lazily so their
+#   first entries are downloading while later pages are still being fetched
+def _iter_urls(rows, run):
+    journal = run.journal
+    for row_number, url in rows:
+        url = str(url).strip()
+        if not url:
+            continue
+        if run.url_rows is not None:
+            run.url_rows.setdefault(url, row_number)
+        if _given_up_on(run, url):
+            continue
+
+        urls = [url]
+        if is_playlist_url(url):
+            urls = (track_url for track_url in _iter_playlist(url, run) if not _given_up_on(run, track_url))
+
+        for track_url in urls:
+            if journal and journal.previous(track_url) is None:
+                journal.record(track_url, JobJournal.QUEUED, sync=False)
+            if run.progress is not None:
+                run.progress.queued()
+            yield track_url
+
+
+# --------------------------------------- _given_up_on ---------------------------------------
+# - True (and logged) for a URL whose failure record shows it failed permanently
+#   in `skip_failed_after` runs or more; see [retry] and --retry-failed
+def _given_up_on(run, url):
+    if not run.skip_failed_after:
+        return False
+    record = run.ledger.failure(url)
+    if not record or record.error_class != "permanent" or record.attempts < run.skip_failed_after:
+        return False
+    logger.info(f"Failed {record.attempts} times since {record.first_seen} ({record.reason}), skipping: {url}")
+    return True
+
+
+# --------------------------------------- _iter_playlist ---------------------------------------
+def _iter_playlist(url, run):
+    try:
+        yield from run.session().iter_playlist(url)
+    except Exception as e:
+        reason = str(e).removeprefix("ERROR: ").strip()
+        logger.error(f"Error [{_parse_source(url)}] expanding playlist {url}: {reason}")
+        run.ledger.add_failed_download(url, reason)
+
+
+# --------------------------------------- _run_pool ---------------------------------------
+# - Feed work items (URLs, or a WorkQueue's (url, attempt) pairs) to the pool as
+#   slots free up instead of queuing the whole list, so lazily expanded
+#   playlists stay lazy
+# - Returns what `work` returned for each item, in completion order
+def _run_pool(pool, items, run, jobs, work=_download_item):
+    results = []
+    pending = set()
+    for item in items:
+        pending.add(pool.submit(work, item, run))
+        if len(pending) >= jobs * 2:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                results.append(future.result())
+    for future in as_completed(pending):
+        results.append(future.result())
+    return results
+
+
+# --------------------------------------- _ordered_urls ---------------------------------------
+# - The list's URLs in --order: as listed (streamed), or by track duration,
+#   which means extracting every row (into the metadata cache) up front
+def _ordered_urls(rows, run, order, jobs):
+    urls = _iter_urls(rows, run)
+    if order == "list":
+        return urls
+
+    workers = max(jobs, 4)
+    logger.info(f"Extracting every row to order by duration ({workers} workers)...")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        durations = _run_pool(pool, urls, run, workers, work=_duration_of)
+    # Unknown durations (failed extraction) go last either way
+    sign = -1 if order == "longest" else 1
+    durations.sort(key=lambda d: (d[1] is None, sign * (d[1] or 0)))
+    return [url for url, _ in durations]
+
+
+# --------------------------------------- _duration_of ---------------------------------------
+def _duration_of(url, run):
+    if (run.journal.previous(url) or {}).get("stage") in JobJournal.DONE:
+        return url, 0  # skipped straight away
+    try:
+        return url, run.extract(url, _parse_source(url)).get("duration")
+    except Exception:
+        return url, None  # the download attempt reports the error
+
+
+# --------------------------------------- _plan_row ---------------------------------------
+# - Extract one URL (through the cache) and run the skip checks, downloading nothing
+def _plan_row(url, run):
+    row = {"url": url, "source": _parse_source(url), "name": url, "bytes": None, "extractor": None}
+    try:
+        info_dict = run.session().extract(url)
+    except Exception as e:
+        return {**row, "action": "fail", "reason": str(e).removeprefix("ERROR: ").strip()}
+
+    _, _, cleaned_title, cleaned_artist_name = _track_names(info_dict)
+    row.update(
+        name=f"{cleaned_artist_name} - {cleaned_title}",
+        bytes=info_dict.get("filesize") or info_dict.get("filesize_approx"),
+        extractor=info_dict.get("extractor_key"),
+    )
+    key = normalize_track_key(cleaned_artist_name, cleaned_title)
+    with _ledger_lock:
+        skip = _skip_reason(run, key, cleaned_artist_name, cleaned_title)
+    if skip is None:
+        return {**row, "action": "download", "reason": ""}
+
+    reason, detail = skip
+    if reason == "exists":
+        reason = f"on disk: {os.path.basename(detail)}"
+    elif reason == "fuzzy":
+        reason = f"probable duplicate ({detail.score:.2f}) of {detail.artist} - {detail.title}"
+    return {**row, "action": "skip", "reason": reason}
+
+
+def _format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m" if hours else f"{minutes}m {seconds:02d}s"
+
+
+# Download speed assumed for --plan when nothing was downloaded from an extractor yet
+_DEFAULT_THROUGHPUT = 1024 * 1024
+
+
+# --------------------------------------- _plan_downloads ---------------------------------------
+# - --plan: extract every row concurrently and print what a real run would do,
+#   with the download size and time estimated from past throughput
+def _plan_downloads(rows, run, jobs):
+    # Extraction is mostly waiting on the network, so use a few workers even without -j
+    workers = max(jobs, 4)
+    logger.info(f"Planning with {workers} extraction workers...")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        rows = _run_pool(pool, _iter_urls(rows, run), run, workers, work=_plan_row)
+
+    table = Table(title="Download plan")
+    for column in ("Action", "Track", "Source", "Size", "Reason"):
+        table.add_column(column)
+    order = {"download": 0, "skip": 1, "fail": 2}
+    for row in sorted(rows, key=lambda r: order[r["action"]]):
+        size = f"{row['bytes'] / 1e6:.1f} MB" if row["bytes"] else "?"
+        # Titles and yt-dlp errors contain [brackets] that rich would read as markup
+        table.add_row(*(escape(str(cell)) for cell in (row["action"], row["name"], row["source"], size, row["reason"])))
+    Console().print(table)
+
+    # Size and time of what would be downloaded; rows without a size count as average
+    todo = [r for r in rows if r["action"] == "download"]
+    sized = [r["bytes"] for r in todo if r["bytes"]]
+    average = sum(sized) / len(sized) if sized else 0
+    total_bytes = 0
+    seconds = 0.0
+    measured = True
+    for row in todo:
+        nbytes = row["bytes"] or average
+        rate = run.cache.throughput(row["extractor"])
+        if rate is None:
+            rate, measured = _DEFAULT_THROUGHPUT, False
+        total_bytes += nbytes
+        seconds += nbytes / rate
+    eta = seconds / max(1, jobs)
+
+    skipped = sum(r["action"] == "skip" for r in rows)
+    failed = sum(r["action"] == "fail" for r in rows)
+    logger.info(
+        f"Plan: {len(todo)} to download, {skipped} to skip, {failed} failed to extract; "
+        f"~{total_bytes / 1e6:.0f} MB, ~{_format_duration(eta)} with {max(1, jobs)} worker(s)"
+        + ("" if measured else " (throughput partly assumed at 1 MB/s)")
+    )
+
+
 # --------------------------------------- download_music_from_xlsx ---------------------------------------
 # - Download music files from an Excel file containing URLs
 def download_music_from_xlsx(args):
     logger.info(args)
     file = args.get("file")
     output_dir = args.get("output")  # Can be None
+    jobs = max(1, args.get("jobs") or 1)
 
-    if not os.path.exists(file):
+    if file != "-" and not os.path.exists(file):
         logger.error(f"File {file} does not exist")
         return
 
-    # Load all sheet names
-    xls = pd.ExcelFile(file)
-    sheet_names = xls.sheet_names
-
     try:
-        # Try loading from available sheets
-        if "music-download-list" in sheet_names:
-            source_sheet = "music-download-list"
-        elif "toDownload" in sheet_names:
-            source_sheet = "toDownload"
-        elif "Found" in sheet_names:
-            source_sheet = "Found"
-        elif "found" in sheet_names:
-            source_sheet = "found"
-        else:
-            logger.error("No suitable sheet found in Excel file.")
-            return
-        df = pd.read_excel(file, sheet_name=source_sheet)
+        source_sheet = None
+        if file != "-" and list_format(file) == ".xlsx":
+            source_sheet = _source_sheet(file)
+            if source_sheet is None:
+                logger.error("No suitable sheet found in Excel file.")
+                return
+        # (row, URL) pairs streamed from the list as the run consumes them
+        rows = read_list(file, ["URL"], sheet_name=source_sheet)
     except Exception as e:
-        logger.error(f"Error reading Excel file: {e}")
+        logger.error(f"Error reading {file}: {e}")
+        return
+
+    # The journal, timings and duplicates report are kept next to the list
+    state_file = file if file != "-" else os.path.join(output_dir or ".", "download-list")
+
+    # The ledger workbook is the list itself, or --ledger; a SQLite --ledger
+    # (or the default one next to the list) is used as is
+    ledger_arg = args.get("ledger")
+    if ledger_arg and ledger_arg.lower().endswith(DB_EXTENSIONS):
+        ledger_db, ledger_book = ledger_arg, (file if source_sheet else None)
+    else:
+        ledger_book = ledger_arg or (file if source_sheet else None)
+        ledger_db = None if ledger_book else default_ledger_path(state_file)
+    if ledger_book and not os.path.exists(ledger_book):
+        logger.error(f"Ledger workbook {ledger_book} does not exist")
+        return
+    ledger_sheet = source_sheet if ledger_book == file else None
+    url_rows = {} if ledger_sheet else None
+    skip_failed_after = 0 if args.get("retry_failed") else get_config("retry", "skip_failed_after", 3)
+
+    # Files already in the output directory (and library, if given)
+    library = LibraryIndex(output_dir or ".", args.get("library") or [])
+
+    if args.get("plan"):
+        # Dry run: no journal, ledger writes, output directory or downloads
+        with open_ledger(ledger_book, ledger_db, read_only=True) as ledger:
+            logger.info(f"Loaded {len(ledger)} past downloads")
+            fuzzy = _build_fuzzy_index(ledger, library, args.get("fuzzy_threshold"))
+            run = _DownloadRun(
+                file, output_dir, library, fuzzy, ledger, InfoCache(), None, None,
+                refresh_metadata=args.get("refresh_metadata"), skip_failed_after=skip_failed_after,
+            )
+            try:
+                _plan_downloads(rows, run, jobs)
+            finally:
+                run.close()
         return
 
     # Create output directory if it doesn't exist
@@ -80,108 +640,142 @@ def download_music_from_xlsx(args):
         os.makedirs(output_dir)
         logger.info(f"Created output directory: {output_dir}")
 
-    for index, row in df.iterrows():
-        try:
-            url = row["URL"]
-        except KeyError as e:
-            logger.error(f"Missing 'URL' column at row {index}: {e}")
-            continue
+    # Every URL's progress is journaled next to the workbook so --resume can
+    # pick up after a crash
+    journal = JobJournal.for_workbook(state_file, resume=args.get("resume"))
 
-        try:
-            name = url  # fallback if metadata extraction fails
-            source = _parse_source(url)
-
-            # Simulate metadata extraction to get title and artist
-            # using yt-dlp to extract metadata without downloading
-            with yt_dlp.YoutubeDL(
-                {"quiet": True, "logger": YtDlpLogger(logger), "remote_components": ["ejs:github"], **({"js_runtimes": {_JS_RUNTIME: {}}} if _JS_RUNTIME else {})}
-            ) as ydl:
-                info_dict = ydl.extract_info(url, download=False)
-                title_raw = (
-                    info_dict.get("title", "Unknown Title").strip().replace("/", "-")
-                )
-                title = (
-                    title_raw.split("-", 1)[-1].strip()
-                    if "-" in title_raw
-                    else title_raw
-                )
+    # Per-stage timings of every track, summarized at the end of the run
+    timings = TimingReport.for_workbook(state_file)
 
-                uploader = (
-                    info_dict.get("uploader", "Unknown Uploader")
-                    .strip()
-                    .replace("/", "-")
-                )
+    def _on_ledger_flush(past_urls, failed_urls, seconds):
+        timings.record("ledger_write", seconds, rows=len(past_urls) + len(failed_urls))
+        for url in past_urls:
+            journal.record(url, JobJournal.LEDGERED)
+        for url in failed_urls:
+            journal.record(url, JobJournal.FAILED)
 
-                # Use semantic metadata if available
-                track = info_dict.get("track")
-                artist = info_dict.get("artist")
-                if "-" in title_raw:
-                    parts = title_raw.split("-", 1)
-                    artist_name = parts[0].strip().replace("/", "-")
-                    title = parts[1].strip().replace("/", "-")
-                elif track and artist:
-                    title = track.strip().replace("/", "-")
-                    artist_name = artist.strip().replace("/", "-")
-                else:
-                    title = title_raw
-                    artist_name = uploader
-
-            # Clean up both artist and title using the shared keyword cleaner
-            cleaned_title = clean_keywords(title)
-            cleaned_artist_name = clean_keywords(artist_name)
-
-            # Set the base name for the file
-            base_name = f"{cleaned_artist_name} - {cleaned_title}.m4a"
-
-            # Check if file already exists on disk
-            full_path = os.path.join(output_dir, base_name) if output_dir else base_name
-            if os.path.exists(full_path):
-                logger.info(f"Already exists, skipping: {full_path}")
-                continue
-
-            # Check if already logged in pastDownloads sheet
-            if is_already_downloaded(file, cleaned_title, cleaned_artist_name):
-                logger.info(
-                    f"Already exists, skipping: {cleaned_artist_name} - {cleaned_title}"
-                )
-                continue
-
-            # Create filename template to output with yt-dlp
-            outtmpl = full_path.replace(".m4a", ".%(ext)s")
-
-            # Download the file using yt-dlp
-            name = os.path.basename(outtmpl).replace(".%(ext)s", "")
-            source = _parse_source(url)
-            logger.info(f"Downloading > {name} | {source}")
-            logger.info(f"Saving to > {full_path}")
-            download_file(
-                outtmpl,
-                url,
-                metadata={"title": cleaned_title, "artist": cleaned_artist_name},
+    def _on_workbook_save(seconds, size):
+        timings.record("workbook_save", seconds, bytes=size)
+
+    # Leaving this block (even on Ctrl-C) closes the ledger, which saves what an
+    # Excel ledger still has buffered. The post-processing pool is closed
+    # first, so every finished track is ledgered.
+    ledger = open_ledger(
+        ledger_book, ledger_db, ledger_sheet, on_flush=_on_ledger_flush, on_save=_on_workbook_save,
+        url_rows=url_rows,
+    )
+    with journal, timings, ledger:
+        logger.info(f"Loaded {len(ledger)} past downloads")
+        fuzzy = _build_fuzzy_index(ledger, library, args.get("fuzzy_threshold"))
+        with PostProcessPool(workers=args.get("pp_jobs")) as pp_pool:
+            run = _DownloadRun(
+                file, output_dir, library, fuzzy, ledger, InfoCache(), journal, pp_pool,
+                refresh_metadata=args.get("refresh_metadata"), timings=timings, url_rows=url_rows,
+                skip_failed_after=skip_failed_after,
             )
+            logger.info(f"Downloading with {jobs} worker(s), post-processing with {pp_pool.workers}")
+            # One shared live display: the overall bar plus a row per track in flight
+            run.progress = RunProgress()
+            try:
+                with run.progress:
+                    # The list first, then transient failures again after a backoff
+                    run.queue = WorkQueue(_ordered_urls(rows, run, args.get("order") or "list", jobs))
+                    if jobs == 1:
+                        for item in run.queue:
+                            _download_item(item, run)
+                    else:
+                        pool = ThreadPoolExecutor(max_workers=jobs)
+                        try:
+                            _run_pool(pool, run.queue, run, jobs)
+                        finally:
+                            # On Ctrl-C drop everything still queued; running tracks finish
+                            pool.shutdown(wait=True, cancel_futures=True)
+                    # Let the last tracks finish post-processing under the live display
+                    pp_pool.close()
+            finally:
+                run.close()
+                _write_duplicates_report(state_file, run.duplicates)
+    timings.print_summary()
 
-            # Append the newly downloaded file to the past downloads sheet
-            append_to_past_downloads(file, url, title, artist_name)
-        except Exception as e:
-            reason = str(e).removeprefix("ERROR: ").strip()
-            logger.error(f"Error [{source}] {name}: {reason}")
-            append_to_failed_downloads(file, url, reason)
-            mark_url_red(file, url, source_sheet)
 
-    deduplicate_failed_downloads(file)
+# --------------------------------------- _source_sheet ---------------------------------------
+# - The sheet of a workbook holding the download list, or None
+def _source_sheet(file):
+    names = sheet_names(file)
+    for name in ("music-download-list", "toDownload", "Found", "found"):
+        if name in names:
+            return name
+    return None
 
 
 # --------------------------------------- create_subparser ---------------------------------------
 def create_subparser(subparsers):
     command_parser = subparsers.add_parser(
         "downloadMusicList",
-        help="Download music from xlsx file",
+        help="Download music from an xlsx, csv, jsonl or plain URL list",
         aliases=["download", "download-music", "dl"],
     )
     command_parser.add_argument(
-        "--file", required=True, help="The xlsx file containing music download list"
+        "--file", required=True,
+        help="The music download list: .xlsx, .csv or .jsonl with a URL column, a .txt/.urls/.list of URLs, or - for stdin",
+    )
+    command_parser.add_argument(
+        "--ledger",
+        default=None,
+        help="Ledger of past/failed downloads: a .db SQLite file, or a workbook to import from (sqlite backend) or "
+             "keep the sheets in (excel backend). Default: next to / inside the list",
     )
     command_parser.add_argument(
         "--output", default=None, help="Directory to save downloaded files"
     )
+    command_parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="Number of URLs to extract and download in parallel (default: 1)",
+    )
+    command_parser.add_argument(
+        "--pp-jobs",
+        type=int,
+        default=None,
+        help="Number of tracks post-processed (ffmpeg) in parallel (default: CPU count - 1)",
+    )
+    command_parser.add_argument(
+        "--library",
+        action="append",
+        help="Music library folder (e.g. Categories) to check for tracks already on disk; repeatable",
+    )
+    command_parser.add_argument(
+        "--fuzzy-threshold",
+        type=float,
+        default=None,
+        help="Similarity (0-1) at which a track counts as a probable duplicate; 0 disables (default: [duplicates] threshold)",
+    )
+    command_parser.add_argument(
+        "--refresh-metadata",
+        action="store_true",
+        help="Ignore cached metadata and re-extract every URL",
+    )
+    command_parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="Extract every row and print what would be downloaded or skipped, without downloading",
+    )
+    command_parser.add_argument(
+        "--order",
+        choices=["list", "shortest", "longest"],
+        default="list",
+        help="Download in list order, or shortest/longest tracks first (extracts every row up front)",
+    )
+    command_parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="Also try URLs that failed permanently in earlier runs (see skip_failed_after under [retry])",
+    )
+    command_parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted run from its journal instead of starting over",
+    )
     command_parser.set_defaults(func=download_music_from_xlsx)
@@ -1,7 +1,11 @@
-import pandas as pd
+import os
+
 import yt_dlp
 
 # Utils
+from src.controllers.ExcelWorkbookController import ExcelWorkbookController
+from src.utils.infoCache import InfoCache
+from src.utils.listFiles import ListWriter, list_format, read_list
 from src.config import get_logger
 
 logger = get_logger(__name__)
@@ -11,65 +15,93 @@ logger = get_logger(__name__)
 # - Get YouTube URLs from an Excel file containing song data (ie. artist and title)
 def get_song_info(args):
     input_file = args.get("file")
-    output_file = input_file.replace(".xlsx", "_with_urls.xlsx")
+    refresh = args.get("refresh_metadata")
+    in_workbook = input_file != "-" and list_format(input_file) == ".xlsx"
 
     try:
-        # Read the "pastDownloads" sheet
-        df = pd.read_excel(input_file, sheet_name="pastDownloads")
+        # The "pastDownloads" sheet of a workbook; any other list as a whole
+        rows = read_list(input_file, sheet_name="pastDownloads" if in_workbook else None)
     except Exception as e:
-        logger.error(f"Error reading Excel file or sheet: {e}")
+        logger.error(f"Error reading {input_file}: {e}")
         return
 
-    # Add columns to hold metadata
-    df["Uploader"] = ""
-    df["Title"] = ""
-
-    for index, row in df.iterrows():
-        try:
-            url = row["URL"]
-        except KeyError as e:
-            logger.error(f"Missing 'URL' column at row {index}: {e}")
-            continue
-
-        # Skip if URL is empty, NaN, or placeholder
-        if not isinstance(url, str) or url.strip() == "" or url.strip() == "---":
-            logger.info(f"Skipping invalid or placeholder URL at row {index}")
-            continue
-
-        try:
-            # Simulate metadata extraction
-            with yt_dlp.YoutubeDL({"quiet": True}) as ydl:
-                info_dict = ydl.extract_info(url, download=False)
-                title = (
-                    info_dict.get("title", "Unknown Title").strip().replace("/", "-")
-                )
-                uploader = (
-                    info_dict.get("uploader", "Unknown Uploader")
-                    .strip()
-                    .replace("/", "-")
-                )
-
-                # Update the DataFrame with the extracted metadata
-                df.at[index, "Uploader"] = uploader
-                df.at[index, "Title"] = title
-
-                logger.info(f"Processed row {index}: {title} by {uploader}")
-
-        except Exception as e:
-            logger.error(f"Error processing URL at row {index}: {url} — {e}")
+    with InfoCache() as cache, yt_dlp.YoutubeDL({"quiet": True}) as ydl:
+        if in_workbook:
+            _update_workbook(input_file, rows, cache, ydl, refresh)
+        else:
+            output_file = args.get("output") or _default_output(input_file)
+            with ListWriter(output_file, extra_columns=["Uploader", "Title"]) as writer:
+                for index, row in rows:
+                    _fill_song_info(index, row, cache, ydl, refresh)
+                    writer.write(row)
+            logger.info(f"Saved {writer.count} rows to {output_file}")
+
+
+# --------------------------------------- _default_output ---------------------------------------
+# - `<list>_with_info` in the list's own format; CSV for plain URL lists and stdin
+def _default_output(input_file):
+    stem, ext = os.path.splitext("list" if input_file == "-" else input_file)
+    if ext.lower() != ".jsonl":
+        ext = ".csv"
+    return f"{stem}_with_info{ext}"
+
+
+# --------------------------------------- _update_workbook ---------------------------------------
+# - Write the filled-in rows back into the workbook as one sheet
+def _update_workbook(input_file, rows, cache, ydl, refresh):
+    records = []
+    for index, row in rows:
+        # Add columns to hold metadata
+        row["Uploader"] = ""
+        row["Title"] = ""
+        _fill_song_info(index, row, cache, ydl, refresh)
+        records.append(row)
 
     try:
-        # Save the updated DataFrame
-        with pd.ExcelWriter(
-            input_file, mode="a", if_sheet_exists="replace", engine="openpyxl"
-        ) as writer:
-            df.to_excel(writer, sheet_name="pastDownloadss", index=False)
+        with ExcelWorkbookController(input_file) as book:
+            book.add_records("pastDownloadss", records)
+            book.save_workbook()
 
         logger.info(f"Updated file saved as: {input_file}")
     except Exception as e:
         logger.error(f"Error writing Excel file: {e}")
 
 
+# --------------------------------------- _fill_song_info ---------------------------------------
+# - Fill the Uploader/Title of a row (a dict) from its URL
+def _fill_song_info(index, row, cache, ydl, refresh=False):
+    lowered = {str(k).strip().lower(): v for k, v in row.items()}
+    url = lowered.get("url")
+
+    # Skip if URL is empty or placeholder
+    if not isinstance(url, str) or url.strip() == "" or url.strip() == "---":
+        logger.info(f"Skipping invalid or placeholder URL at row {index}")
+        return
+
+    try:
+        # Metadata comes from the on-disk cache when it's fresh enough
+        info_dict = cache.fetch(
+            url, lambda u: ydl.extract_info(u, download=False), refresh=refresh
+        )
+        title = (
+            info_dict.get("title", "Unknown Title").strip().replace("/", "-")
+        )
+        uploader = (
+            info_dict.get("uploader", "Unknown Uploader")
+            .strip()
+            .replace("/", "-")
+        )
+
+        # Update the row with the extracted metadata
+        row["Uploader"] = uploader
+        row["Title"] = title
+
+        logger.info(f"Processed row {index}: {title} by {uploader}")
+
+    except Exception as e:
+        logger.error(f"Error processing URL at row {index}: {url} — {e}")
+
+
 # --------------------------------------- create_subparser ---------------------------------------
 # - Create a subparser for the getYouTubeUrls command
 def create_subparser(subparsers):
@@ -84,7 +116,20 @@ def create_subparser(subparsers):
         "--file",
         "-s",
         required=True,
-        help="Path to the input Excel file containing song data (URL column is required)",
+        help="Input list with a URL column: .xlsx (its pastDownloads sheet), .csv, .jsonl, a .txt/.urls/.list of URLs, or - for stdin",
+    )
+
+    command_parser.add_argument(
+        "--output",
+        "-o",
+        default=None,
+        help="Output .csv or .jsonl for non-Excel lists (default: <input>_with_info); workbooks are updated in place",
+    )
+
+    command_parser.add_argument(
+        "--refresh-metadata",
+        action="store_true",
+        help="Ignore cached metadata and re-extract every URL",
     )
 
     command_parser.set_defaults(func=get_song_info)
@@ -1,6 +1,8 @@
-import pandas as pd  # type: ignore
+import os
 
 # Utils
+from src.controllers.ExcelWorkbookController import ExcelWorkbookController
+from src.utils.listFiles import ListWriter, list_format, read_list
 from src.utils.ytDownloader import search_youtube_url
 
 from src.config import get_logger
@@ -12,52 +14,92 @@ logger = get_logger(__name__)
 # - Get YouTube URLs from an Excel file containing song data (ie. artist and title)
 def get_youtube_urls(args):
     input_file = args.get("file")
-    output_file = input_file.replace(".xlsx", "_with_urls.xlsx")
-
-    # Load the Excel file
-    df = pd.read_excel(input_file)
-
-    # Add a new column for YouTube URLs if it doesn't exist
-    if "URL" not in df.columns:
-        df["URL"] = ""
-
+    output_file = args.get("output") or _default_output(input_file)
+
+    try:
+        # Rows as dicts, so every input column is kept in the output
+        rows = read_list(input_file)
+    except Exception as e:
+        logger.error(f"Error reading {input_file}: {e}")
+        return
+
+    if list_format(output_file) == ".xlsx":
+        _write_workbook(rows, output_file)
+    else:
+        _write_list(rows, output_file)
+
+
+# --------------------------------------- _default_output ---------------------------------------
+# - `<list>_with_urls` in the list's own format; CSV for plain URL lists and stdin
+def _default_output(input_file):
+    stem, ext = os.path.splitext("list" if input_file == "-" else input_file)
+    if ext.lower() not in (".xlsx", ".jsonl"):
+        ext = ".csv"
+    return f"{stem}_with_urls{ext}"
+
+
+# --------------------------------------- _search_row ---------------------------------------
+# - Look up a row's track on YouTube and set its URL; returns None if the row has no artist/title
+def _search_row(row):
+    lowered = {str(k).strip().lower(): v for k, v in row.items()}
+    artist = lowered.get("zartistname") or lowered.get("artist")
+    title = lowered.get("ztitle") or lowered.get("title")
+    if not artist or not title:
+        return None
+
+    logger.info(f"Searching for: {artist} - {title}")
+    url = search_youtube_url(artist, title)
+    row["URL"] = url or ""
+    return bool(url)
+
+
+# --------------------------------------- _write_workbook ---------------------------------------
+# - Found/Not found sheets, written once every row has been searched
+def _write_workbook(rows, output_file):
     found_rows = []
     not_found_rows = []
 
     # Loop through each row
-    for idx, row in df.iterrows():
-        artist = row.get("ZARTISTNAME") or row.get("artist") or row.get("Artist")
-        title = row.get("ZTITLE") or row.get("title") or row.get("Title")
-
-        if pd.notna(artist) and pd.notna(title):
-            logger.info(f"Searching for: {artist} - {title}")
-            url = search_youtube_url(artist, title)
-            if url:
-                row["URL"] = url
-                found_rows.append(row)
-            else:
-                not_found_rows.append(row)
-
-    # Create DataFrames
-    found_df = pd.DataFrame(found_rows)
-    not_found_df = pd.DataFrame(not_found_rows)
-
-    # Save both DataFrames into one Excel file with two sheets
-    with pd.ExcelWriter(output_file) as writer:
-        found_df.to_excel(writer, sheet_name="Found", index=False)
-        not_found_df.to_excel(writer, sheet_name="Not found", index=False)
+    for _, row in rows:
+        found = _search_row(row)
+        if found:
+            found_rows.append(row)
+        elif found is not None:
+            not_found_rows.append(row)
+
+    # Save both sheets into one new Excel file
+    with ExcelWorkbookController(output_file, new=True) as book:
+        book.add_records("Found", found_rows)
+        book.add_records("Not found", not_found_rows)
+        book.save_workbook()
 
     logger.info(
-        f"Done! {len(found_df)} songs found, {len(not_found_df)} not found. Results saved to {output_file}"
+        f"Done! {len(found_rows)} songs found, {len(not_found_rows)} not found. Results saved to {output_file}"
     )
 
 
+# --------------------------------------- _write_list ---------------------------------------
+# - One CSV/JSONL row per searched track, written as it's found; URL is empty when not found
+def _write_list(rows, output_file):
+    found = not_found = 0
+    with ListWriter(output_file, extra_columns=["URL"]) as writer:
+        for _, row in rows:
+            result = _search_row(row)
+            if result is None:
+                continue
+            writer.write(row)
+            found += result
+            not_found += not result
+
+    logger.info(f"Done! {found} songs found, {not_found} not found. Results saved to {output_file}")
+
+
 # --------------------------------------- create_subparser ---------------------------------------
 # - Create a subparser for the getYouTubeUrls command
 def create_subparser(subparsers):
     command_parser = subparsers.add_parser(
         "getYouTubeUrls",
-        help="Search songs from an Excel file and fetch YouTube URLs",
+        help="Search songs from an xlsx, csv or jsonl list and fetch YouTube URLs",
         aliases=["getUrls", "geturls"],
     )
 
@@ -66,7 +108,14 @@ def create_subparser(subparsers):
         "--file",
         "-s",
         required=True,
-        help="Path to the input Excel file containing song data (ZARTISTNAME and ZTITLE columns are required)",
+        help="Input list (.xlsx, .csv, .jsonl, or - for stdin) with ZARTISTNAME/Artist and ZTITLE/Title columns",
+    )
+
+    command_parser.add_argument(
+        "--output",
+        "-o",
+        default=None,
+        help="Output .xlsx (Found/Not found sheets), .csv or .jsonl (default: <input>_with_urls in the input's format)",
     )
 
     # Optional argument for music directory (not used here, but kept for compatibility)
@@ -0,0 +1,76 @@
+import os
+
+# Utils
+from src.utils.ledger import SqliteLedger, default_ledger_path
+
+from src.config import get_logger
+
+logger = get_logger(__name__)
+
+
+# --------------------------------------- import_ledger ---------------------------------------
+# - Merge a workbook's pastDownloads/failedDownloads sheets into its SQLite ledger
+def import_ledger(args):
+    file = args.get("file")
+    if not os.path.exists(file):
+        logger.error(f"File {file} does not exist")
+        return
+
+    with SqliteLedger(args.get("ledger") or default_ledger_path(file)) as ledger:
+        ledger.import_workbook(file)
+
+
+# --------------------------------------- export_ledger ---------------------------------------
+# - Write the SQLite ledger out as pastDownloads/failedDownloads sheets
+def export_ledger(args):
+    file = args.get("file")
+    path = args.get("ledger") or default_ledger_path(file)
+    if not os.path.exists(path):
+        logger.error(f"Ledger {path} does not exist")
+        return
+
+    output_file = args.get("output") or file
+    with SqliteLedger(path, read_only=True) as ledger:
+        try:
+            ledger.export_workbook(output_file)
+        except Exception as e:
+            logger.error(f"Error writing Excel file: {e}")
+            return
+        logger.info(
+            f"Exported {len(ledger.past_downloads())} past and {len(ledger.failed_downloads())} "
+            f"failed downloads to {output_file}"
+        )
+
+
+# --------------------------------------- create_subparser ---------------------------------------
+# - Create a subparser for the ledger command and its import/export actions
+def create_subparser(subparsers):
+    command_parser = subparsers.add_parser(
+        "ledger",
+        help="Import or export the SQLite ledger of past and failed downloads",
+    )
+    actions = command_parser.add_subparsers()
+
+    import_parser = actions.add_parser(
+        "import", help="Merge a workbook's pastDownloads/failedDownloads sheets into the ledger"
+    )
+    import_parser.set_defaults(func=import_ledger)
+
+    export_parser = actions.add_parser(
+        "export", help="Write the ledger as pastDownloads/failedDownloads sheets"
+    )
+    export_parser.add_argument(
+        "--output",
+        "-o",
+        default=None,
+        help="Workbook to write the sheets into, created if missing (default: --file)",
+    )
+    export_parser.set_defaults(func=export_ledger)
+
+    for action_parser in (import_parser, export_parser):
+        action_parser.add_argument(
+            "--file", required=True, help="The workbook (download list) the ledger belongs to"
+        )
+        action_parser.add_argument(
+            "--ledger", default=None, help="SQLite ledger file (default: <file>.ledger.db)"
+        )
@@ -0,0 +1,164 @@
+import re
+import threading
+from collections import defaultdict, namedtuple
+
+from src.config import get_config, get_logger
+
+# Utils
+from src.utils.metadata import normalize_track_key
+
+logger = get_logger(__name__)
+
+# Version qualifiers that don't make a different recording ("Remix", "VIP" do)
+_VARIANT_WORDS = {
+    "original", "extended", "mix", "radio", "edit", "club", "version",
+    "clean", "dirty", "explicit", "remaster", "remastered", "and", "the",
+}
+
+# Query tokens seen in more than this share of entries are too common to block on
+_COMMON_SHARE = 0.02
+# ...and a query scores at most this many candidates
+_MAX_CANDIDATES = 200
+
+FuzzyMatch = namedtuple("FuzzyMatch", "score artist title source")
+
+# Words introducing a part/volume number ("Part 2", "Pt. II", "Vol 3")
+_PART_WORDS = {"part", "pt", "vol", "volume", "chapter", "ch", "episode", "ep", "book", "no"}
+_PART_RE = re.compile(r"^(part|pt|vol|volume|chapter|ch|episode|ep|book|no)(\d+)$")
+_ROMAN = {"i": 1, "ii": 2, "iii": 3, "iv": 4, "v": 5, "vi": 6, "vii": 7, "viii": 8, "ix": 9, "x": 10}
+_NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+}
+
+
+def _words(artist, title):
+    artist, title = normalize_track_key(artist, title)
+    return [w for w in f"{artist} {title}".split() if w not in _VARIANT_WORDS]
+
+
+def _trigrams(words):
+    # Spacing/punctuation-insensitive: "don t" and "dont" share all trigrams
+    text = "".join(words)
+    return frozenset(text[i:i + 3] for i in range(max(1, len(text) - 2)))
+
+
+def _numbers(words):
+    # Part/volume numbers, which tell tracks apart: "Part 2", "Pt II" and
+    # "Part Two" agree. Other numbers (a year, a BPM) are ordinary words, since
+    # often only one side of a duplicate carries them
+    numbers = set()
+    previous = None
+    for word in words:
+        part = _PART_RE.match(word)
+        if part:
+            numbers.add(int(part.group(2)))
+        elif previous in _PART_WORDS:
+            if word.isdigit():
+                numbers.add(int(word))
+            elif word in _ROMAN:
+                numbers.add(_ROMAN[word])
+            elif word in _NUMBER_WORDS:
+                numbers.add(_NUMBER_WORDS[word])
+        previous = word
+    return frozenset(numbers)
+
+
+def _dice(a, b):
+    return 2 * len(a & b) / (len(a) + len(b)) if a or b else 0.0
+
+
+# --------------------------------- FuzzyIndex ---------------------------------
+class FuzzyIndex:
+    """"Is this probably a track we already have?" over pastDownloads and the library.
+
+    Each entry is reduced to a set of normalized tokens (see
+    `normalize_track_key`, minus qualifiers such as "Original"/"Extended Mix").
+    A query only scores entries sharing one of its rarer tokens (an inverted
+    index does the blocking), so lookups stay well under a millisecond at
+    100k entries; a query made only of very common tokens is not matched.
+    The score is the better of the token-set and the character trigram Dice
+    similarity, so both reordered credits and punctuation or spacing variants
+    match, but only between entries with the same part/volume numbers
+    ("Part 1" is not "Part 2", nor "Vol. II" "Vol. III"). Anything at or
+    above `threshold` (default `[duplicates] threshold` in config.toml) is
+    reported as a duplicate; a threshold of 0 turns matching off.
+    """
+
+    def __init__(self, threshold=None):
+        if threshold is None:
+            threshold = get_config("duplicates", "threshold", 0)
+        self.threshold = threshold
+        self._entries = []
+        self._postings = defaultdict(list)
+        self._removed = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries) - self._removed
+
+    def add(self, artist, title, source):
+        """Index a track; `source` says where it came from, for the report."""
+        words = _words(artist, title)
+        if not words:
+            return
+        tokens = frozenset(words)
+        with self._lock:
+            entry_id = len(self._entries)
+            self._entries.append((tokens, _trigrams(words), _numbers(words), artist, title, source))
+            for token in tokens:
+                self._postings[token].append(entry_id)
+
+    def remove(self, artist, title, source):
+        """Drop the latest entry added with these exact arguments, if any."""
+        words = _words(artist, title)
+        if not words:
+            return
+        tokens = frozenset(words)
+        with self._lock:
+            posting = self._postings.get(words[0], ())
+            for entry_id in reversed(posting):
+                entry = self._entries[entry_id]
+                if entry[0] == tokens and entry[3:] == (artist, title, source):
+                    break
+            else:
+                return
+            for token in tokens:
+                self._postings[token].remove(entry_id)
+            self._entries[entry_id] = None
+            self._removed += 1
+
+    def match(self, artist, title):
+        """Best FuzzyMatch at or above the threshold, or None."""
+        if not self.threshold:
+            return None
+        words = _words(artist, title)
+        if not words:
+            return None
+        tokens = frozenset(words)
+
+        with self._lock:
+            # Block on the rarest tokens; common ones ("remix", "feat") would
+            # pull in a large part of the index for nothing
+            ranked = sorted(tokens, key=lambda t: len(self._postings.get(t, ())))
+            limit = min(_MAX_CANDIDATES, max(50, int(len(self) * _COMMON_SHARE)))
+            candidates = set()
+            for token in ranked:
+                posting = self._postings.get(token, ())
+                if len(candidates) + len(posting) > limit:
+                    break
+                candidates.update(posting)
+
+            trigrams = _trigrams(words)
+            numbers = _numbers(words)
+            best = None
+            for entry_id in candidates:
+                entry_tokens, entry_trigrams, entry_numbers, *entry = self._entries[entry_id]
+                if entry_numbers != numbers:
+                    continue
+                score = _dice(tokens, entry_tokens)
+                if score < self.threshold:
+                    score = max(score, _dice(trigrams, entry_trigrams))
+                if score >= self.threshold and (best is None or score > best.score):
+                    best = FuzzyMatch(round(score, 3), *entry)
+        return best
@@ -0,0 +1,194 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import yt_dlp
+
+from src.config import get_config, get_logger
+
+logger = get_logger(__name__)
+
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "djas"
+)
+
+# Set on info dicts served from the cache, holding the canonical URL they were
+# stored under. yt-dlp drops "__" keys when sanitizing, so it never reaches
+# process_ie_result.
+CACHED_KEY = "__djas_cached"
+
+# Bulky fields only needed to pick and fetch formats; downloads re-extract
+# anyway because the stream URLs in a cached entry expire
+_DROP_KEYS = {
+    "formats", "thumbnails", "automatic_captions", "subtitles", "heatmap",
+    "http_headers", "fragments", "url", "manifest_url",
+}
+
+# Query parameters that never change what a URL points to
+_TRACKING_PARAMS = {"si", "feature", "fbclid", "gclid", "ref", "in", "pp", "ab_channel"}
+
+
+# --------------------------------- canonical_url ---------------------------------
+def canonical_url(url):
+    """Normalize `url` so share links and tracking variants map to one cache key."""
+    parts = urlsplit(str(url).strip())
+    host = parts.netloc.lower()
+    for prefix in ("www.", "m.", "music."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    path = parts.path.rstrip("/") or "/"
+    query = [
+        (k, v) for k, v in parse_qsl(parts.query)
+        if k not in _TRACKING_PARAMS and not k.startswith("utm_")
+    ]
+
+    # youtu.be/<id> and youtube.com/watch?v=<id> are the same video
+    if host == "youtu.be" and path != "/":
+        query.insert(0, ("v", path.lstrip("/")))
+        host, path = "youtube.com", "/watch"
+    if host == "youtube.com" and path == "/watch":
+        query = [(k, v) for k, v in query if k in ("v", "list")]
+
+    return urlunsplit(("https", host, path, urlencode(sorted(query)), ""))
+
+
+# --------------------------------- InfoCache ---------------------------------
+class InfoCache:
+    """On-disk cache of sanitized yt-dlp info dicts keyed by canonical URL.
+
+    Entries are zlib-compressed JSON rows in a SQLite file under
+    `~/.cache/djas/`. Entries older than `ttl_hours` are ignored, and once the
+    cache grows past `max_size_mb` the least recently used rows are evicted.
+    The same file keeps the measured download throughput per extractor. Safe
+    to share between worker threads.
+    """
+
+    def __init__(self, path=None, ttl_hours=None, max_size_mb=None):
+        self.path = path or os.path.join(
+            get_config("cache", "dir", CACHE_DIR), "info.sqlite3"
+        )
+        self.ttl = (ttl_hours or get_config("cache", "ttl_hours", 168)) * 3600
+        self.max_bytes = (max_size_mb or get_config("cache", "max_size_mb", 256)) * 1024 * 1024
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS info ("
+            " url TEXT PRIMARY KEY, fetched REAL, accessed REAL, size INTEGER, data BLOB)"
+        )
+        # Decayed byte/second totals of past downloads per extractor, for ETAs
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS throughput (extractor TEXT PRIMARY KEY, bytes REAL, seconds REAL)"
+        )
+        self._size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM info").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def get(self, url):
+        """Cached info dict for `url`, or None if missing or older than the TTL."""
+        key = canonical_url(url)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT fetched, data FROM info WHERE url = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            fetched, data = row
+            if time.time() - fetched > self.ttl:
+                self._delete(key)
+                return None
+            self._db.execute("UPDATE info SET accessed = ? WHERE url = ?", (time.time(), key))
+            self._db.commit()
+        info = json.loads(zlib.decompress(data))
+        info[CACHED_KEY] = key
+        return info
+
+    def put(self, url, info):
+        """Store a freshly extracted info dict; playlists are not cached."""
+        if not info or info.get("_type", "video") != "video":
+            return
+        info = yt_dlp.YoutubeDL.sanitize_info(info, remove_private_keys=True)
+        info = {k: v for k, v in info.items() if k not in _DROP_KEYS}
+        data = zlib.compress(json.dumps(info).encode("utf-8"))
+        key = canonical_url(url)
+        now = time.time()
+        with self._lock:
+            self._delete(key)
+            self._db.execute(
+                "INSERT INTO info (url, fetched, accessed, size, data) VALUES (?, ?, ?, ?, ?)",
+                (key, now, now, len(data), data),
+            )
+            self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+            self._db.commit()
+
+    def fetch(self, url, extract, refresh=False):
+        """Cached info for `url`, falling back to `extract(url)` and caching the result.
+
+        With `refresh` the cache is not read, but the new result still replaces
+        the old entry.
+        """
+        if not refresh:
+            info = self.get(url)
+            if info is not None:
+                return info
+        info = extract(url)
+        try:
+            self.put(url, info)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning(f"Could not cache metadata for {url}: {e}")
+        return info
+
+    def record_throughput(self, extractor, nbytes, seconds):
+        """Fold one finished download into the extractor's running throughput."""
+        if not extractor or seconds <= 0:
+            return
+        with self._lock:
+            # Older downloads fade out so the estimate follows the current connection
+            self._db.execute(
+                "INSERT INTO throughput (extractor, bytes, seconds) VALUES (?, ?, ?) "
+                "ON CONFLICT(extractor) DO UPDATE SET "
+                "bytes = bytes * 0.95 + excluded.bytes, seconds = seconds * 0.95 + excluded.seconds",
+                (extractor, nbytes, seconds),
+            )
+            self._db.commit()
+
+    def throughput(self, extractor):
+        """Measured bytes/second for `extractor` (e.g. "Youtube"), or None if never measured."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT bytes, seconds FROM throughput WHERE extractor = ?", (extractor,)
+            ).fetchone()
+        return row[0] / row[1] if row and row[1] else None
+
+    def _delete(self, key):
+        row = self._db.execute("SELECT size FROM info WHERE url = ?", (key,)).fetchone()
+        if row:
+            self._db.execute("DELETE FROM info WHERE url = ?", (key,))
+            self._size -= row[0]
+
+    def _evict(self):
+        # Drop least recently used rows until back under 90% of the limit
+        target = self.max_bytes * 0.9
+        for key, size in self._db.execute(
+            "SELECT url, size FROM info ORDER BY accessed"
+        ).fetchall():
+            if self._size <= target:
+                break
+            self._db.execute("DELETE FROM info WHERE url = ?", (key,))
+            self._size -= size
@@ -0,0 +1,84 @@
+import json
+import os
+import threading
+import time
+
+from src.config import get_logger
+
+logger = get_logger(__name__)
+
+
+# --------------------------------- JobJournal ---------------------------------
+class JobJournal:
+    """Append-only JSONL record of how far each URL of a download run got.
+
+    Lives next to the workbook as `<workbook>.journal.jsonl`. Every stage change
+    is one line, flushed and fsynced, so the file survives a crash or a
+    sleeping WSL VM. A new run starts a fresh journal; with `resume=True` the
+    existing one is read back (see `previous`) and appended to instead.
+    """
+
+    # Stages a URL moves through, in order
+    QUEUED = "queued"
+    EXTRACTED = "extracted"
+    DOWNLOADED = "downloaded"
+    POSTPROCESSED = "postprocessed"
+    LEDGERED = "ledgered"
+    # Terminal outcomes besides LEDGERED
+    SKIPPED = "skipped"
+    FAILED = "failed"
+
+    DONE = (LEDGERED, SKIPPED, FAILED)
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self._lock = threading.Lock()
+        self._previous = {}
+
+        if resume and os.path.exists(path):
+            self._load()
+            logger.info(f"Resuming from {path} ({len(self._previous)} URLs journaled)")
+        mode = "a" if resume else "w"
+        self._fp = open(path, mode, encoding="utf-8")
+
+    @classmethod
+    def for_workbook(cls, file, resume=False):
+        return cls(os.path.splitext(file)[0] + ".journal.jsonl", resume=resume)
+
+    def _load(self):
+        with open(self.path, encoding="utf-8") as fp:
+            for line in fp:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # torn last line from a crash mid-write
+                url = entry["url"]
+                # Re-queuing on an earlier resume must not undo progress
+                if entry["stage"] == self.QUEUED and url in self._previous:
+                    continue
+                # Later lines carry forward the fields recorded by earlier stages
+                self._previous[url] = {**self._previous.get(url, {}), **entry}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            self._fp.close()
+
+    def previous(self, url):
+        """Where `url` got to in the run being resumed (stage plus recorded fields), or None."""
+        return self._previous.get(url)
+
+    def record(self, url, stage, sync=True, **fields):
+        """Append a stage change; `sync=False` skips the fsync for cheap, bulk lines."""
+        entry = {"t": round(time.time(), 3), "url": url, "stage": stage, **fields}
+        line = json.dumps(entry, ensure_ascii=False)
+        with self._lock:
+            self._fp.write(line + "\n")
+            self._fp.flush()
+            if sync:
+                os.fsync(self._fp.fileno())
@@ -0,0 +1,334 @@
+import datetime
+import os
+import sqlite3
+import threading
+import time
+
+from src.config import get_config, get_logger
+from src.controllers.ExcelWorkbookController import ExcelWorkbookController
+
+# Utils
+from src.utils.listFiles import read_list
+from src.utils.workQueue import classify_error
+from src.utils.xlsx import (
+    FailureRecord,
+    LedgerWriter,
+    PastDownloadsIndex,
+    _FAILED_COLUMNS,
+    _PAST_COLUMNS,
+    _date_text,
+    _failure_row,
+    _sanitize_for_excel,
+    aggregate_failures,
+    compact_failures,
+    find_failure,
+    mark_urls_red,
+    past_download_key,
+)
+
+logger = get_logger(__name__)
+
+# File extensions taken as a SQLite ledger rather than a workbook
+DB_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS past_downloads (
+    url TEXT UNIQUE,
+    date TEXT,
+    title TEXT,
+    uploader TEXT,
+    title_key TEXT,
+    uploader_key TEXT
+);
+CREATE INDEX IF NOT EXISTS past_downloads_key ON past_downloads (title_key, uploader_key);
+CREATE TABLE IF NOT EXISTS failed_downloads (
+    url TEXT PRIMARY KEY,
+    first_seen TEXT,
+    last_seen TEXT,
+    attempts INTEGER,
+    reason TEXT,
+    error_class TEXT
+);
+"""
+
+_FAILURE_FIELDS = "url, first_seen, last_seen, attempts, reason, error_class"
+
+
+def _today():
+    return datetime.date.today().strftime("%m/%d/%Y")
+
+
+# --------------------------------- default_ledger_path ---------------------------------
+def default_ledger_path(file):
+    """The SQLite ledger kept next to `file` (a workbook or list): `<file>.ledger.db`."""
+    return os.path.splitext(file)[0] + ".ledger.db"
+
+
+# --------------------------------- SqliteLedger ---------------------------------
+class SqliteLedger:
+    """pastDownloads / failedDownloads kept in a SQLite file, one row per URL.
+
+    A failed URL has a single record (FailureRecord) updated in place each
+    time it fails again, so the table grows with the number of dead URLs,
+    not with the number of runs.
+
+    Lookups by URL and by normalized (title, uploader) are indexed, and every
+    append is a single-row insert, so neither depends on how long the
+    history is. A new database is filled from the pastDownloads and
+    failedDownloads sheets of `import_from` (a workbook), if given.
+
+    `on_flush(past_urls, failed_urls, seconds)` is called after each write,
+    like LedgerWriter's. With `highlight=(workbook, sheet)` the rows of URLs
+    that failed are colored red in that sheet on `close`, in one save, found
+    through `url_rows` ({url: row number}) when given. With `read_only=True`
+    writes are ignored. Safe to share between worker threads.
+    """
+
+    def __init__(self, path, import_from=None, highlight=None, on_flush=None, read_only=False,
+                 url_rows=None):
+        self.path = path
+        self.highlight = highlight
+        self.url_rows = url_rows
+        self.on_flush = on_flush
+        self.read_only = read_only
+        self._failed_urls = set()
+        self._lock = threading.Lock()
+        is_new = not os.path.exists(path)
+        # A dry run against a ledger that doesn't exist yet leaves no file behind
+        self._db = sqlite3.connect(":memory:" if is_new and read_only else path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        if is_new and import_from and os.path.exists(import_from):
+            self.import_workbook(import_from)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+        if self.highlight and self._failed_urls:
+            workbook, sheet_name = self.highlight
+            try:
+                mark_urls_red(workbook, self._failed_urls, sheet_name, url_rows=self.url_rows)
+            except Exception as e:
+                logger.error(f"Could not highlight failed rows in {workbook}: {e}")
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM past_downloads").fetchone()[0]
+
+    def __iter__(self):
+        """Normalized (title, uploader) pairs, like PastDownloadsIndex."""
+        with self._lock:
+            return iter(self._db.execute("SELECT title_key, uploader_key FROM past_downloads").fetchall())
+
+    def contains(self, title, uploader):
+        with self._lock:
+            return self._db.execute(
+                "SELECT 1 FROM past_downloads WHERE title_key = ? AND uploader_key = ? LIMIT 1",
+                past_download_key(title, uploader),
+            ).fetchone() is not None
+
+    def _write(self, sql, params, past_urls=(), failed_urls=()):
+        if self.read_only:
+            return
+        started = time.perf_counter()
+        with self._lock:
+            with self._db:
+                self._db.execute(sql, params)
+        if self.on_flush:
+            self.on_flush(list(past_urls), list(failed_urls), time.perf_counter() - started)
+
+    def add_past_download(self, url, title, uploader, date=None):
+        self._write(
+            "INSERT OR REPLACE INTO past_downloads VALUES (?, ?, ?, ?, ?, ?)",
+            (url, date or _today(), title, uploader, *past_download_key(title, uploader)),
+            past_urls=[url],
+        )
+
+    def add_failed_download(self, url, reason, error_class=None, date=None):
+        self._failed_urls.add(url)
+        reason = _sanitize_for_excel(str(reason))
+        date = date or _today()
+        self._write(
+            f"INSERT INTO failed_downloads ({_FAILURE_FIELDS}) VALUES (?, ?, ?, 1, ?, ?) "
+            "ON CONFLICT (url) DO UPDATE SET last_seen = excluded.last_seen, "
+            "attempts = attempts + 1, reason = excluded.reason, error_class = excluded.error_class",
+            (url, date, date, reason, error_class or classify_error(reason)),
+            failed_urls=[url],
+        )
+
+    def failure(self, url):
+        """The FailureRecord of `url`, or None if it never failed."""
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {_FAILURE_FIELDS} FROM failed_downloads WHERE url = ?", (url,)
+            ).fetchone()
+        return FailureRecord(*row) if row else None
+
+    def past_downloads(self):
+        """pastDownloads rows, ordered like its sheet columns."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT date, url, title, uploader FROM past_downloads ORDER BY rowid"
+            ).fetchall()
+
+    def failed_downloads(self):
+        """failedDownloads rows, ordered like its sheet columns."""
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {_FAILURE_FIELDS} FROM failed_downloads ORDER BY rowid"
+            ).fetchall()
+        return [_failure_row(FailureRecord(*row)) for row in rows]
+
+    def import_workbook(self, file):
+        """Merge the pastDownloads/failedDownloads sheets of `file` in, by URL; returns the row counts."""
+        past = self._import_sheet(
+            file, "pastDownloads",
+            "INSERT OR IGNORE INTO past_downloads VALUES (?, ?, ?, ?, ?, ?)",
+            lambda row: (
+                row.get("URL"), _date_text(row.get("Date Downloaded")), row.get("Title"), row.get("Uploader"),
+                *past_download_key(row.get("Title"), row.get("Uploader")),
+            ),
+        )
+        failed = self._import_failures(file)
+        logger.info(f"Imported {past} past and {failed} failed downloads from {file} into {self.path}")
+        return past, failed
+
+    def _import_failures(self, file):
+        # One record per URL, however many rows an older sheet has for it
+        try:
+            rows = read_list(file, sheet_name="failedDownloads")
+        except KeyError:
+            return 0
+        records = aggregate_failures(tuple(row.get(c) for c in _FAILED_COLUMNS) for _, row in rows)
+        with self._lock:
+            with self._db:
+                self._db.executemany(
+                    f"INSERT OR REPLACE INTO failed_downloads ({_FAILURE_FIELDS}) VALUES (?, ?, ?, ?, ?, ?)",
+                    records.values(),
+                )
+        return len(records)
+
+    def _import_sheet(self, file, sheet_name, sql, to_params):
+        try:
+            rows = read_list(file, sheet_name=sheet_name)
+        except KeyError:
+            return 0  # no such sheet
+        params = [
+            to_params(row) for _, row in rows
+            if row.get("Title") is not None and row.get("Uploader") is not None
+        ]
+        with self._lock:
+            with self._db:
+                self._db.executemany(sql, params)
+        return len(params)
+
+    def export_workbook(self, file):
+        """Write pastDownloads/failedDownloads sheets into `file` (created if missing), replacing those sheets."""
+        with ExcelWorkbookController(file) as book:
+            for sheet_name, columns, rows in (
+                ("pastDownloads", _PAST_COLUMNS, self.past_downloads()),
+                ("failedDownloads", _FAILED_COLUMNS, self.failed_downloads()),
+            ):
+                book.reset_sheet(sheet_name, columns)
+                book.append_rows(sheet_name, columns, rows)
+
+
+# --------------------------------- ExcelLedger ---------------------------------
+class ExcelLedger:
+    """The pastDownloads / failedDownloads sheets of a workbook as the ledger.
+
+    The workbook is loaded once into an ExcelWorkbookController; lookups go
+    to a PastDownloadsIndex built from it, and appends are recorded in it by
+    a LedgerWriter (see there for `on_flush`, checkpoint saves and the red
+    fills of `sheet_name`); `on_save(seconds, size)` reports each save of the
+    workbook. An older failedDownloads sheet with a row per failure is folded
+    into one row per URL first. With `file=None` there is no history and
+    nothing is written anywhere.
+
+    The whole workbook is held in memory, the list sheet too if it lives in
+    the same file, as openpyxl can't save back a partly loaded workbook.
+    """
+
+    def __init__(self, file, sheet_name=None, on_flush=None, read_only=False, on_save=None,
+                 url_rows=None):
+        self.path = file
+        self._book = ExcelWorkbookController(file, read_only=read_only, on_save=on_save) if file else None
+        self._index = PastDownloadsIndex.from_workbook(self._book) if file else PastDownloadsIndex()
+        if file:
+            compact_failures(self._book)
+        self._index_lock = threading.Lock()
+        self._writer = None if read_only else LedgerWriter(
+            self._book, sheet_name, on_flush=on_flush, url_rows=url_rows
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._book is not None:
+            self._book.close()
+
+    def __len__(self):
+        return len(self._index)
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def contains(self, title, uploader):
+        with self._index_lock:
+            return self._index.contains(title, uploader)
+
+    def add_past_download(self, url, title, uploader):
+        with self._index_lock:
+            self._index.add(title, uploader)
+        if self._writer is not None:
+            self._writer.add_past_download(url, title, uploader)
+
+    def add_failed_download(self, url, reason, error_class=None):
+        if self._writer is not None:
+            self._writer.add_failed_download(url, reason, error_class)
+
+    def failure(self, url):
+        """The FailureRecord of `url`, or None if it never failed."""
+        return find_failure(self._book, url) if self._book is not None else None
+
+
+# --------------------------------- open_ledger ---------------------------------
+def open_ledger(workbook=None, db=None, sheet_name=None, on_flush=None, read_only=False, on_save=None,
+                url_rows=None):
+    """The ledger of a run, per `[ledger] backend` in config.toml.
+
+    `workbook` holds (or held) the pastDownloads/failedDownloads sheets, and
+    `sheet_name` is the list sheet in it whose failed rows get colored red,
+    found through `url_rows` ({url: row number}) if the caller collects it.
+    The "sqlite" backend (default) uses `db`, else the file next to
+    `workbook`, importing the sheets the first time; "excel" uses the sheets
+    themselves, and reports each save of the workbook to `on_save(seconds,
+    size)`. Without either file there is no history.
+    """
+    backend = get_config("ledger", "backend", "sqlite")
+    if backend == "excel":
+        return ExcelLedger(
+            workbook, sheet_name, on_flush=on_flush, read_only=read_only, on_save=on_save, url_rows=url_rows
+        )
+    if backend != "sqlite":
+        raise ValueError(f'Unknown ledger backend "{backend}"')
+    if db is None and workbook is None:
+        return ExcelLedger(None, read_only=read_only)
+    highlight = (workbook, sheet_name) if workbook and sheet_name else None
+    return SqliteLedger(
+        db or default_ledger_path(workbook), import_from=workbook,
+        highlight=highlight, on_flush=on_flush, read_only=read_only, url_rows=url_rows,
+    )
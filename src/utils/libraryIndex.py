@@ -0,0 +1,82 @@
+import os
+import threading
+import time
+
+from src.config import get_logger
+
+# Utils
+from src.utils.metadata import normalize_track_key
+
+logger = get_logger(__name__)
+
+AUDIO_EXTENSIONS = (".mp3", ".m4a", ".flac", ".wav", ".opus", ".aac", ".aiff", ".alac")
+
+
+# --------------------------------- LibraryIndex ---------------------------------
+class LibraryIndex:
+    """In-memory index of the tracks already on disk, keyed by normalized artist/title.
+
+    Built with `os.scandir`: the files directly in `output_dir`, plus every
+    folder under each of `library_dirs` (e.g. the sorted `Categories`
+    library). File names are read as `Artist - Title.ext`; see
+    `normalize_track_key` for what counts as the same track. New files are
+    added with `add` as they land. Safe to share between worker threads.
+    """
+
+    def __init__(self, output_dir=None, library_dirs=()):
+        self._paths = {}
+        self._lock = threading.Lock()
+        started = time.monotonic()
+        if output_dir and os.path.isdir(output_dir):
+            self._scan(output_dir, recursive=False)
+        for root in library_dirs:
+            self._scan(root, recursive=True)
+        logger.info(
+            f"Indexed {len(self._paths)} tracks on disk in "
+            f"{time.monotonic() - started:.1f}s"
+        )
+
+    def _scan(self, root, recursive):
+        stack = [root]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            if recursive:
+                                stack.append(entry.path)
+                        elif entry.name.lower().endswith(AUDIO_EXTENSIONS):
+                            self._add(entry.path)
+            except OSError as e:
+                logger.warning(f"Could not scan {e.filename}: {e.strerror}")
+
+    @staticmethod
+    def split_name(path):
+        """(artist, title) from an `Artist - Title.ext` file name."""
+        stem = os.path.splitext(os.path.basename(path))[0]
+        artist, sep, title = stem.partition(" - ")
+        return (artist, title) if sep else ("", stem)
+
+    @classmethod
+    def key_for_path(cls, path):
+        return normalize_track_key(*cls.split_name(path))
+
+    def _add(self, path):
+        self._paths.setdefault(self.key_for_path(path), path)
+
+    def __len__(self):
+        return len(self._paths)
+
+    def paths(self):
+        with self._lock:
+            return list(self._paths.values())
+
+    def add(self, path):
+        """Record a file that was just written."""
+        with self._lock:
+            self._add(path)
+
+    def find(self, artist, title):
+        """Path of a file on disk for this track, or None."""
+        with self._lock:
+            return self._paths.get(normalize_track_key(artist, title))
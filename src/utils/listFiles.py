@@ -0,0 +1,234 @@
+import csv
+import itertools
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from openpyxl import load_workbook
+
+from src.config import get_logger
+
+logger = get_logger(__name__)
+
+# Extensions read as one URL per line ("#" starts a comment)
+URL_LIST_EXTENSIONS = (".txt", ".urls", ".list")
+
+
+# --------------------------------- Readers ---------------------------------
+# Each reader returns (header, rows, close): rows yields (row_number, values)
+# with values a tuple ordered like header, or a dict when header is None
+
+
+def _open_xlsx(file, sheet_name=None):
+    # Read from a temporary copy, so a LedgerWriter can save the workbook
+    # while the rows are still being consumed
+    snapshot = tempfile.TemporaryFile()
+    try:
+        with open(file, "rb") as fp:
+            shutil.copyfileobj(fp, snapshot)
+        wb = load_workbook(snapshot, read_only=True, data_only=True)
+    except Exception:
+        snapshot.close()
+        raise
+
+    def close():
+        wb.close()
+        snapshot.close()
+
+    try:
+        ws = wb[sheet_name] if sheet_name else wb.worksheets[0]
+        rows = ws.iter_rows(values_only=True)
+        header = list(next(rows, ()))
+    except Exception:
+        close()
+        raise
+    return header, enumerate(rows, start=2), close
+
+
+def _open_csv(lines):
+    reader = csv.reader(lines)
+    header = next(reader, [])
+    rows = ((n, tuple(value or None for value in row)) for n, row in enumerate(reader, start=2))
+    return header, rows, None
+
+
+def _open_jsonl(lines):
+    def rows():
+        for n, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                logger.warning(f"Skipping line {n}: not valid JSON")
+                continue
+            # A bare string is taken as a URL
+            yield n, entry if isinstance(entry, dict) else {"URL": entry}
+
+    return None, rows(), None
+
+
+def _open_url_list(lines):
+    rows = (
+        (n, (line.strip(),))
+        for n, line in enumerate(lines, start=1)
+        if line.strip() and not line.lstrip().startswith("#")
+    )
+    return ["URL"], rows, None
+
+
+_TEXT_READERS = {
+    ".csv": _open_csv,
+    ".jsonl": _open_jsonl,
+    **{ext: _open_url_list for ext in URL_LIST_EXTENSIONS},
+}
+
+
+def _sniff(first_line):
+    # Format of a list piped to stdin, which has no extension to go by
+    line = first_line.lstrip()
+    if line.startswith(("{", '"')):
+        return ".jsonl"
+    if line.lower().startswith("http"):
+        return ".txt"
+    return ".csv"  # a header row
+
+
+# --------------------------------- list_format ---------------------------------
+def list_format(file):
+    """Extension `file` is read as (".xlsx", ".csv", ...); "-" (stdin) is sniffed instead."""
+    ext = os.path.splitext(file)[1].lower()
+    if ext == ".xlsx" or ext in _TEXT_READERS:
+        return ext
+    raise ValueError(
+        f"Unsupported list file {file}; use .xlsx, .csv, .jsonl, "
+        f"{', '.join(URL_LIST_EXTENSIONS)} or - for stdin"
+    )
+
+
+# --------------------------------- read_list ---------------------------------
+def read_list(file, columns=None, sheet_name=None):
+    """Stream the rows of a track list, whatever its format.
+
+    `file` is an Excel workbook (`sheet_name`, else the first sheet), a CSV
+    with a header row, JSONL with one object per line, a plain list of URLs
+    (.txt/.urls/.list), or "-" to read any of the text formats from stdin.
+    Rows are parsed one at a time, so memory stays flat and the first row is
+    available at once.
+
+    With `columns` (header names, or tuples of alternative names) yields
+    `(row_number, *values)`; headers match case-insensitively and a missing
+    column raises KeyError up front (JSONL rows just get None). Without,
+    yields `(row_number, {header: value})`. Blank rows are skipped.
+    """
+    if file == "-":
+        lines = iter(sys.stdin)
+        first = next((line for line in lines if line.strip()), "")
+        lines = itertools.chain([first], lines)
+        header, rows, close = _TEXT_READERS[_sniff(first)](lines)
+    elif list_format(file) == ".xlsx":
+        header, rows, close = _open_xlsx(file, sheet_name)
+    else:
+        fp = open(file, newline="", encoding="utf-8-sig")
+        try:
+            header, rows, _ = _TEXT_READERS[list_format(file)](fp)
+        except Exception:
+            fp.close()
+            raise
+        close = fp.close
+
+    try:
+        pick = _column_picker(header, columns, file)
+    except Exception:
+        if close:
+            close()
+        raise
+    return _stream(rows, pick, close)
+
+
+def _column_picker(header, columns, where):
+    # Function turning one raw row into the values read_list yields for it
+    if header is None:  # JSONL: keys are looked up per row
+        if columns is None:
+            return lambda row: (row,)
+
+        def pick(row):
+            lowered = {str(k).strip().lower(): v for k, v in row.items()}
+            return tuple(
+                next((lowered[a] for a in _aliases(spec) if lowered.get(a) is not None), None)
+                for spec in columns
+            )
+        return pick
+
+    names = [str(name or "").strip() for name in header]
+    if columns is None:
+        return lambda row: (dict(zip(names, row)),)
+
+    lowered = [name.lower() for name in names]
+    positions = []
+    for spec in columns:
+        position = next((lowered.index(a) for a in _aliases(spec) if a in lowered), None)
+        if position is None:
+            raise KeyError(f"No '{spec if isinstance(spec, str) else spec[0]}' column in {where}")
+        positions.append(position)
+    return lambda row: tuple(row[i] if i < len(row) else None for i in positions)
+
+
+def _aliases(spec):
+    return tuple(name.lower() for name in ((spec,) if isinstance(spec, str) else spec))
+
+
+def _is_blank(values):
+    if len(values) == 1 and isinstance(values[0], dict):
+        values = values[0].values()
+    return all(value in (None, "") for value in values)
+
+
+def _stream(rows, pick, close):
+    try:
+        for row_number, row in rows:
+            values = pick(row)
+            if not _is_blank(values):
+                yield (row_number, *values)
+    finally:
+        if close:
+            close()
+
+
+# --------------------------------- ListWriter ---------------------------------
+class ListWriter:
+    """Write dict rows to a .csv or .jsonl file as they come.
+
+    CSV columns are those of the first row plus `extra_columns`; keys other
+    rows add are dropped.
+    """
+
+    def __init__(self, path, extra_columns=()):
+        self.path = path
+        self.extra_columns = list(extra_columns)
+        self.count = 0
+        self._jsonl = list_format(path) == ".jsonl"
+        self._fp = open(path, "w", newline="", encoding="utf-8")
+        self._csv = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._fp.close()
+
+    def write(self, row):
+        if self._jsonl:
+            self._fp.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+        else:
+            if self._csv is None:
+                columns = list(row) + [c for c in self.extra_columns if c not in row]
+                self._csv = csv.DictWriter(self._fp, columns, extrasaction="ignore")
+                self._csv.writeheader()
+            self._csv.writerow(row)
+        self.count += 1
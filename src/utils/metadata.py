@@ -50,3 +50,32 @@ def remove_special_characters(text):
         not in ["C", "S"]  # Remove Other (C) and Symbol (S) categories
     )
     return cleaned.strip()
+
+
+# --------------------------------- normalize_track_key ---------------------------------
+# Qualifiers that don't make a different track
+_REDUNDANT_RE = re.compile(r"[\(\[]\s*(original mix|original|official (audio|video)|audio)\s*[\)\]]", re.IGNORECASE)
+# "(feat. X)" / "[ft X]": only the bracket holding the credit
+_FEAT_BRACKET_RE = re.compile(r"[\(\[]\s*(feat|ft|featuring)\b[^\)\]]*[\)\]]", re.IGNORECASE)
+# Unbracketed "feat. X", up to a following "(...)", "[...]" or " - Mix name"
+_FEAT_RE = re.compile(r"\b(feat|ft|featuring)\b\.?.*?(?=[\(\[]|\s-\s|$)", re.IGNORECASE)
+
+
+def _normalize_name(text):
+    text = unicodedata.normalize("NFKD", str(text))
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = _REDUNDANT_RE.sub(" ", text)
+    text = _FEAT_BRACKET_RE.sub(" ", text)
+    text = _FEAT_RE.sub(" ", text)
+    text = text.casefold().replace("&", " and ")
+    text = re.sub(r"[^\w]+", " ", text)
+    return " ".join(text.split())
+
+
+def normalize_track_key(artist, title):
+    """(artist, title) normalized so spelling variants of one track compare equal.
+
+    Case, accents, punctuation, "(Original Mix)" and featured artists are
+    ignored, so "Artist ft. X - Title (Original Mix)" matches "artist - title".
+    """
+    return _normalize_name(artist), _normalize_name(title)
@@ -0,0 +1,127 @@
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from src.config import get_config, get_logger
+
+logger = get_logger(__name__)
+
+# What yt-dlp says when a site wants us to slow down
+_THROTTLE_RE = re.compile(
+    r"HTTP Error 429|Too Many Requests|rate.?limit|captcha|not a bot|try again later",
+    re.IGNORECASE,
+)
+
+
+# --------------------------------- is_throttled ---------------------------------
+def is_throttled(error):
+    """True if `error` (an exception or message) means the site is rate limiting us."""
+    return bool(_THROTTLE_RE.search(str(error)))
+
+
+# --------------------------------- SourceLimit ---------------------------------
+class SourceLimit:
+    """Token bucket plus concurrency cap for one source.
+
+    `rate` tokens per second refill a bucket of `burst`; every request takes one.
+    On throttling the rate is halved and requests pause for `backoff` seconds,
+    doubling on each repeat up to `max_backoff`. Every success after that
+    raises the rate by a quarter until it is back at the configured value.
+    """
+
+    def __init__(self, name, rate, burst, concurrency, backoff, max_backoff):
+        self.name = name
+        self.max_rate = self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self.base_backoff = self.backoff = float(backoff)
+        self.max_backoff = float(max_backoff)
+        self._tokens = self.burst
+        self._stamp = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(max(1, int(concurrency)))
+
+    def _take_token(self):
+        # Time to wait before a token is available; takes it if there is one
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    @contextmanager
+    def slot(self):
+        with self._slots:
+            while (delay := self._take_token()) > 0:
+                time.sleep(delay)
+            yield
+
+    def throttled(self):
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return  # another worker already backed off for this wave
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+            self._paused_until = now + self.backoff
+            self._tokens = 0
+            logger.warning(
+                f"{self.name} is rate limiting, pausing {self.backoff:.0f}s "
+                f"and slowing to {self.rate:.2f} req/s"
+            )
+            self.backoff = min(self.max_backoff, self.backoff * 2)
+
+    def succeeded(self):
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate * 1.25)
+                if self.rate == self.max_rate:
+                    logger.info(f"{self.name} back to {self.rate:.2f} req/s")
+            self.backoff = self.base_backoff
+
+
+# --------------------------------- RateLimiter ---------------------------------
+class RateLimiter:
+    """Per-source request pacing shared by every worker of a run.
+
+    `classify(url)` maps a URL to its source name (e.g. "YouTube"), which picks
+    the `[rate_limit.<source>]` settings in config.toml; sources without their
+    own table use `[rate_limit.default]`.
+    """
+
+    def __init__(self, classify):
+        self._classify = classify
+        self._limits = {}
+        self._lock = threading.Lock()
+
+    def limit(self, source):
+        with self._lock:
+            if source not in self._limits:
+                conf = get_config("rate_limit", source) or get_config("rate_limit", "default", {})
+                self._limits[source] = SourceLimit(
+                    source,
+                    rate=conf.get("rate", 1.0),
+                    burst=conf.get("burst", 4),
+                    concurrency=conf.get("concurrency", 4),
+                    backoff=get_config("rate_limit", "backoff", 30),
+                    max_backoff=get_config("rate_limit", "max_backoff", 900),
+                )
+            return self._limits[source]
+
+    @contextmanager
+    def request(self, url):
+        """Wait for `url`'s source to allow a request; adapts the pace to how it went."""
+        limit = self.limit(self._classify(url))
+        with limit.slot():
+            try:
+                yield
+            except Exception as e:
+                if is_throttled(e):
+                    limit.throttled()
+                raise
+            limit.succeeded()
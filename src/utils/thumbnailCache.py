@@ -0,0 +1,108 @@
+import hashlib
+import os
+import shutil
+
+from yt_dlp.postprocessor import FFmpegPostProcessor
+
+from src.config import get_config, get_logger
+
+# Utils
+from src.utils.infoCache import CACHE_DIR
+
+try:
+    from PIL import Image  # type: ignore
+except ImportError:  # ffmpeg does the cropping instead
+    Image = None
+
+logger = get_logger(__name__)
+
+# Same square centre crop the ffmpeg postprocessor args used to apply
+_CROP_FILTER = "crop='if(gt(ih,iw),iw,ih)':'if(gt(iw,ih),ih,iw)'"
+
+
+# --------------------------------- ThumbnailCache ---------------------------------
+class ThumbnailCache:
+    """Content-addressed store of cover art, cropped square and encoded as JPEG.
+
+    Keyed by the SHA-1 of the downloaded image, so tracks from the same
+    release or uploader share one prepared cover and the crop/encode runs once
+    per distinct image. Lives in `~/.cache/djas/thumbnails/` (or under
+    `[cache] dir`). Safe across processes: entries are written to a temp file
+    and renamed into place.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or os.path.join(
+            get_config("cache", "dir", CACHE_DIR), "thumbnails"
+        )
+        os.makedirs(self.directory, exist_ok=True)
+
+    def prepare(self, path, ffmpeg=None):
+        """Path of the cached cover for the image at `path`, creating it on first sight.
+
+        `ffmpeg` is an FFmpegPostProcessor, used when Pillow isn't installed.
+        """
+        with open(path, "rb") as fp:
+            digest = hashlib.sha1(fp.read()).hexdigest()
+        cached = os.path.join(self.directory, digest[:2], digest + ".jpg")
+        if os.path.exists(cached):
+            logger.debug(f"Thumbnail cache hit: {digest}")
+            return cached
+
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        temp = f"{cached}.{os.getpid()}.tmp.jpg"
+        try:
+            if Image is not None:
+                _crop_with_pillow(path, temp)
+            else:
+                ffmpeg.run_ffmpeg(path, temp, ["-vf", _CROP_FILTER, "-q:v", "2"])
+            os.replace(temp, cached)
+        finally:
+            if os.path.exists(temp):
+                os.remove(temp)
+        return cached
+
+
+def _crop_with_pillow(path, dest):
+    with Image.open(path) as image:
+        side = min(image.size)
+        left = (image.width - side) // 2
+        top = (image.height - side) // 2
+        cover = image.convert("RGB").crop((left, top, left + side, top + side))
+        cover.save(dest, "JPEG", quality=95)
+
+
+# --------------------------------- ThumbnailCachePP ---------------------------------
+class ThumbnailCachePP(FFmpegPostProcessor):
+    """Swap the downloaded thumbnail for its prepared cover before EmbedThumbnail.
+
+    The cover is hard-linked (or copied) next to the track, because
+    EmbedThumbnail deletes the file it embeds.
+    """
+
+    def __init__(self, downloader=None, cache=None):
+        super().__init__(downloader)
+        self._cache = cache or ThumbnailCache()
+
+    def run(self, info):
+        thumbnails = info.get("thumbnails") or []
+        idx = next((i for i in range(len(thumbnails) - 1, -1, -1) if thumbnails[i].get("filepath")), None)
+        if idx is None or not os.path.exists(thumbnails[idx]["filepath"]):
+            return [], info
+
+        original = thumbnails[idx]["filepath"]
+        try:
+            cached = self._cache.prepare(original, ffmpeg=self)
+        except Exception as e:
+            # EmbedThumbnail still embeds the uncropped original
+            self.report_warning(f"Could not prepare thumbnail: {e}")
+            return [], info
+
+        cover = os.path.splitext(original)[0] + ".jpg"
+        os.remove(original)
+        try:
+            os.link(cached, cover)
+        except OSError:  # e.g. the output dir is on another drive
+            shutil.copyfile(cached, cover)
+        thumbnails[idx]["filepath"] = cover
+        return [], info
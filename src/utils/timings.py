@@ -0,0 +1,120 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+from rich.console import Console
+from rich.table import Table
+
+from src.config import get_logger
+
+logger = get_logger(__name__)
+
+
+def _percentile(values, pct):
+    # Nearest-rank on a sorted list; plenty for a run summary
+    return values[min(len(values) - 1, round(pct / 100 * (len(values) - 1)))]
+
+
+# --------------------------------- TimingReport ---------------------------------
+class TimingReport:
+    """How long each stage of each track took in one download run.
+
+    Every `record` is a JSONL line `{t, url, source, stage, seconds, ...}` in
+    `<workbook>.timings.jsonl`, rewritten per run. `print_summary` shows
+    p50/p95 per stage, overall and per source, and the download speed per
+    source and number of concurrent fragments for records carrying `bytes`
+    and `fragments`. Safe to share between worker threads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._samples = defaultdict(list)
+        self._speeds = defaultdict(list)
+        self._fp = open(path, "w", encoding="utf-8")
+
+    @classmethod
+    def for_workbook(cls, file):
+        return cls(os.path.splitext(file)[0] + ".timings.jsonl")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            self._fp.close()
+
+    def record(self, stage, seconds, url="", source="", **fields):
+        entry = {
+            "t": round(time.time(), 3), "url": url, "source": source,
+            "stage": stage, "seconds": round(seconds, 4), **fields,
+        }
+        with self._lock:
+            self._samples[(stage, source)].append(seconds)
+            if fields.get("bytes") and fields.get("fragments") and seconds > 0:
+                self._speeds[(source, fields["fragments"])].append(fields["bytes"] / seconds)
+            self._fp.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._fp.flush()
+
+    def summary(self):
+        """(stage, source, count, p50, p95, total) rows.
+
+        Source "all" aggregates a stage; per-source rows follow when the stage
+        saw more than one source.
+        """
+        with self._lock:
+            samples = {key: sorted(values) for key, values in self._samples.items()}
+
+        per_stage = defaultdict(list)
+        for (stage, _), values in samples.items():
+            per_stage[stage].extend(values)
+
+        rows = []
+        for stage in per_stage:
+            sources = sorted(source for s, source in samples if s == stage and source)
+            if len(sources) == 1:
+                sources = []  # same numbers as "all"
+            for source, values in [("all", sorted(per_stage[stage]))] + [
+                (source, samples[(stage, source)]) for source in sources
+            ]:
+                rows.append((
+                    stage, source, len(values),
+                    _percentile(values, 50), _percentile(values, 95), sum(values),
+                ))
+        return rows
+
+    def throughput(self):
+        """(source, fragments, count, p50, p95) rows of download speed in bytes/s."""
+        with self._lock:
+            speeds = {key: sorted(values) for key, values in self._speeds.items()}
+        return [
+            (source, fragments, len(values), _percentile(values, 50), _percentile(values, 95))
+            for (source, fragments), values in sorted(speeds.items())
+        ]
+
+    def print_summary(self):
+        rows = self.summary()
+        if not rows:
+            return
+        table = Table(title=f"Stage timings (seconds), details in {self.path}")
+        for column in ("Stage", "Source", "Count", "p50", "p95", "Total"):
+            table.add_column(column, justify="left" if column in ("Stage", "Source") else "right")
+        for stage, source, count, p50, p95, total in rows:
+            table.add_row(stage, source, str(count), f"{p50:.2f}", f"{p95:.2f}", f"{total:.1f}")
+        Console().print(table)
+
+        speeds = self.throughput()
+        if not speeds:
+            return
+        # One row per source and fragment setting, to compare [fragments] values
+        table = Table(title="Download speed (MB/s) by concurrent fragments")
+        for column in ("Source", "Fragments", "Count", "p50", "p95"):
+            table.add_column(column, justify="left" if column == "Source" else "right")
+        for source, fragments, count, p50, p95 in speeds:
+            table.add_row(source, str(fragments), str(count), f"{p50 / 1e6:.2f}", f"{p95 / 1e6:.2f}")
+        Console().print(table)
@@ -0,0 +1,104 @@
+import heapq
+import itertools
+import re
+import threading
+import time
+
+from src.config import get_config, get_logger
+
+# Utils
+from src.utils.rateLimiter import is_throttled
+
+logger = get_logger(__name__)
+
+# Server trouble that says so, whatever else the message mentions
+_SERVER_RE = re.compile(r"HTTP Error 5\d\d|temporar(il)?y", re.IGNORECASE)
+
+# Errors that won't go away by asking again, even if they mention a timeout
+_PERMANENT_RE = re.compile(
+    r"HTTP Error (400|401|403|404|410|451)|Unsupported URL|"
+    r"(video|track|song|playlist|content) (is )?(unavailable|not available)|This .* is not available|"
+    r"private|removed|copyright|geo.?restrict|sign in|members.only|DRM|No video formats",
+    re.IGNORECASE,
+)
+
+# Network hiccups and server-side trouble worth another attempt later
+_TRANSIENT_RE = re.compile(
+    r"timed? ?out|connection (reset|refused|aborted)|remote end closed|IncompleteRead|"
+    r"temporary failure|name or service not known|getaddrinfo|network is unreachable|"
+    r"HTTP Error 5\d\d|service unavailable|bad gateway|internal server error|"
+    r"SSL|EOF occurred|giving up after \d+ (fragment )?retries|did not get any data",
+    re.IGNORECASE,
+)
+
+
+# --------------------------------- classify_error ---------------------------------
+def classify_error(error):
+    """"transient" if `error` (an exception or message) is worth retrying later, else "permanent"."""
+    message = str(error)
+    if is_throttled(message) or _SERVER_RE.search(message):
+        return "transient"
+    if _PERMANENT_RE.search(message):
+        return "permanent"
+    return "transient" if _TRANSIENT_RE.search(message) else "permanent"
+
+
+# --------------------------------- WorkQueue ---------------------------------
+class WorkQueue:
+    """Hands out `(url, attempt)` pairs: the list first, then retries after backoff.
+
+    `retry` puts a URL back at the end of the queue, eligible again after
+    `backoff` seconds, doubling per attempt up to `max_backoff`, and refuses
+    once it has had `attempts` tries (defaults under `[retry]` in
+    config.toml). Iterating waits for due retries and for items still in
+    flight, which may add more, so every yielded item must be followed by
+    one call to `done`. Safe to share between worker threads.
+    """
+
+    def __init__(self, urls, attempts=None, backoff=None, max_backoff=None):
+        self._urls = iter(urls)
+        self.attempts = attempts or get_config("retry", "attempts", 3)
+        self.backoff = backoff or get_config("retry", "backoff", 15)
+        self.max_backoff = max_backoff or get_config("retry", "max_backoff", 300)
+        self._retries = []  # heap of (due, seq, url, attempt)
+        self._seq = itertools.count()
+        self._active = 0
+        self._cond = threading.Condition()
+
+    def __iter__(self):
+        for url in self._urls:
+            with self._cond:
+                self._active += 1
+            yield url, 1
+
+        while True:
+            with self._cond:
+                while True:
+                    if self._retries:
+                        wait = self._retries[0][0] - time.monotonic()
+                        if wait <= 0:
+                            _, _, url, attempt = heapq.heappop(self._retries)
+                            self._active += 1
+                            break
+                    elif not self._active:
+                        return
+                    else:
+                        wait = None
+                    self._cond.wait(wait)
+            yield url, attempt
+
+    def retry(self, url, attempt):
+        """Queue attempt `attempt + 1` of `url`; returns its delay, or None if out of attempts."""
+        if attempt >= self.attempts:
+            return None
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        with self._cond:
+            heapq.heappush(self._retries, (time.monotonic() + delay, next(self._seq), url, attempt + 1))
+            self._cond.notify_all()
+        return delay
+
+    def done(self):
+        """Mark one handed-out item finished (whatever the outcome)."""
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
@@ -1,11 +1,25 @@
 import datetime
 import re
+import threading
+import time
+from collections import namedtuple
 
-import pandas as pd  # type: ignore
 from openpyxl import load_workbook
-from openpyxl.styles import PatternFill
 
-_RED_FILL = PatternFill(start_color="FFCCCC", end_color="FFCCCC", fill_type="solid")
+from src.config import get_config, get_logger
+from src.controllers.ExcelWorkbookController import ExcelWorkbookController
+
+# Utils
+from src.utils.workQueue import classify_error
+
+logger = get_logger(__name__)
+
+_PAST_COLUMNS = ["Date Downloaded", "URL", "Title", "Uploader"]
+# "Date" is when the URL last failed; older sheets have only the first three
+_FAILED_COLUMNS = ["Date", "URL", "Reason", "First Seen", "Attempts", "Error Class"]
+
+# One URL's failures across runs; error_class is "transient" or "permanent" (see classify_error)
+FailureRecord = namedtuple("FailureRecord", "url first_seen last_seen attempts reason error_class")
 
 
 def _sanitize_for_excel(value: str) -> str:
@@ -17,109 +31,268 @@ def _sanitize_for_excel(value: str) -> str:
     return value
 
 
-# --------------------------------- append_to_failed_downloads ---------------------------------
-def append_to_failed_downloads(file, url, reason):
-    try:
-        failed_df = pd.read_excel(file, sheet_name="failedDownloads")
-    except (FileNotFoundError, ValueError):
-        failed_df = pd.DataFrame(columns=["Date", "URL", "Reason"])
+def _date_text(value):
+    # Dates typed into Excel come back as datetimes
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.strftime("%m/%d/%Y")
+    return value
 
-    new_row = pd.DataFrame([{
-        "Date": datetime.date.today().strftime("%m/%d/%Y"),
-        "URL": url,
-        "Reason": _sanitize_for_excel(str(reason)),
-    }])
 
-    updated_df = pd.concat([failed_df, new_row], ignore_index=True)
+# --------------------------------- failure_record ---------------------------------
+def failure_record(previous, url, reason, error_class=None, date=None):
+    """`previous` (a FailureRecord, or None) updated with one more failure of `url`."""
+    date = date or datetime.date.today().strftime("%m/%d/%Y")
+    reason = _sanitize_for_excel(str(reason))
+    return FailureRecord(
+        url,
+        previous.first_seen if previous else date,
+        date,
+        (previous.attempts if previous else 0) + 1,
+        reason,
+        error_class or classify_error(reason),
+    )
 
-    with pd.ExcelWriter(
-        file, mode="a", if_sheet_exists="replace", engine="openpyxl"
-    ) as writer:
-        updated_df.to_excel(writer, sheet_name="failedDownloads", index=False)
 
+# --------------------------------- aggregate_failures ---------------------------------
+def aggregate_failures(rows):
+    """{url: FailureRecord} from failedDownloads rows (ordered as its columns), oldest first.
 
-# --------------------------------- deduplicate_failed_downloads ---------------------------------
-def deduplicate_failed_downloads(file):
-    try:
-        failed_df = pd.read_excel(file, sheet_name="failedDownloads")
-    except (FileNotFoundError, ValueError):
-        return
+    Sheets written before failures were aggregated have a row per failure and
+    only Date/URL/Reason; those rows are folded into one record per URL.
+    """
+    records = {}
+    for date, url, reason, first_seen, attempts, error_class in rows:
+        if not url:
+            continue
+        previous = records.get(url)
+        date = _date_text(date)
+        records[url] = FailureRecord(
+            url,
+            previous.first_seen if previous else (_date_text(first_seen) or date),
+            date,
+            (previous.attempts if previous else 0) + (int(attempts) if attempts else 1),
+            reason,
+            error_class or classify_error(reason or ""),
+        )
+    return records
 
-    deduped_df = failed_df.drop_duplicates(subset=["URL"], keep="last")
 
-    if len(deduped_df) == len(failed_df):
-        return
+def _failure_row(record):
+    # A FailureRecord as a failedDownloads row
+    return [
+        record.last_seen, record.url, record.reason,
+        record.first_seen, record.attempts, record.error_class,
+    ]
 
-    with pd.ExcelWriter(
-        file, mode="a", if_sheet_exists="replace", engine="openpyxl"
-    ) as writer:
-        deduped_df.to_excel(writer, sheet_name="failedDownloads", index=False)
 
+# --------------------------------- compact_failures ---------------------------------
+def compact_failures(book):
+    """Rewrite the failedDownloads sheet of an open ExcelWorkbookController as one row per URL.
 
-# --------------------------------- mark_url_red ---------------------------------
-def mark_url_red(file, url, sheet_name):
-    """Color the row matching `url` red in the given sheet."""
-    wb = load_workbook(file)
-    if sheet_name not in wb.sheetnames:
+    Only needed once for sheets from before failures were aggregated; a
+    no-op (and no save) for sheets that already are.
+    """
+    rows = book.read_rows("failedDownloads", _FAILED_COLUMNS)
+    records = aggregate_failures(rows)
+    if len(records) == len(rows) and all(row[4] for row in rows):
         return
-    ws = wb[sheet_name]
+    book.reset_sheet("failedDownloads", _FAILED_COLUMNS)
+    book.append_rows("failedDownloads", _FAILED_COLUMNS, [_failure_row(r) for r in records.values()])
 
-    # Find the URL column index from the header row
-    header = next(ws.iter_rows(min_row=1, max_row=1))
-    url_col = next(
-        (cell.column for cell in header if str(cell.value or "").strip().lower() == "url"),
-        None,
-    )
-    if url_col is None:
-        return
 
-    for row in ws.iter_rows(min_row=2):
-        if row[url_col - 1].value == url:
-            for cell in row:
-                cell.fill = _RED_FILL
-            break
+# --------------------------------- record_failure ---------------------------------
+def record_failure(book, url, reason, error_class=None):
+    """Count one more failure of `url` in its failedDownloads row, updated in place; returns the record."""
+    record = failure_record(find_failure(book, url), url, reason, error_class)
+    book.update_row("failedDownloads", _FAILED_COLUMNS, _failure_row(record))
+    return record
+
 
-    wb.save(file)
+# --------------------------------- find_failure ---------------------------------
+def find_failure(book, url):
+    """The FailureRecord of `url` in the failedDownloads sheet, or None."""
+    row = book.find_row("failedDownloads", url, _FAILED_COLUMNS)
+    return aggregate_failures([row]).get(url) if row else None
 
 
-# --------------------------------- is_already_downloaded ---------------------------------
-def is_already_downloaded(file, title, uploader):
+# --------------------------------- sheet_names ---------------------------------
+def sheet_names(file):
+    """Sheet names of `file`, without loading any sheet."""
+    wb = load_workbook(file, read_only=True)
     try:
-        past_df = pd.read_excel(file, sheet_name="pastDownloads")
-    except (FileNotFoundError, ValueError):
-        return False
+        return wb.sheetnames
+    finally:
+        wb.close()
 
-    if "Title" not in past_df.columns or "Uploader" not in past_df.columns:
-        return False
 
-    match = past_df[
-        (past_df["Title"].str.strip().str.lower() == title.strip().lower()) &
-        (past_df["Uploader"].str.strip().str.lower() == uploader.strip().lower())
-    ]
-    return not match.empty
+# --------------------------------- mark_urls_red ---------------------------------
+def mark_urls_red(file, urls, sheet_name, url_rows=None):
+    """Color every row of `sheet_name` whose URL is in `urls`, in one load and save.
 
+    `url_rows` ({url: row number}, e.g. from read_list while the sheet was
+    read) spares scanning the sheet for the rows.
+    """
+    if not urls:
+        return
+    with ExcelWorkbookController(file) as book:
+        if url_rows is not None:
+            book.set_url_rows(sheet_name, url_rows)
+        book.highlight_urls(sheet_name, set(urls))
 
-# --------------------------------- append_to_past_downloads ---------------------------------
-def append_to_past_downloads(file, url, title, uploader):
-    # Try to load the existing 'pastDownloads' sheet
-    try:
-        past_df = pd.read_excel(file, sheet_name="pastDownloads")
-    except (FileNotFoundError, ValueError):
-        # If the file or sheet doesn't exist, start a new DataFrame
-        past_df = pd.DataFrame(columns=["Date Downloaded", "URL", "Title", "Uploader"])
-
-    # Create the new row
-    new_row = pd.DataFrame([{
-        "Date Downloaded": datetime.date.today().strftime("%m/%d/%Y"),
-        "URL": url,
-        "Title": title,
-        "Uploader": uploader,
-    }])
-
-    # Append and write back
-    updated_df = pd.concat([past_df, new_row], ignore_index=True)
-
-    with pd.ExcelWriter(
-        file, mode="a", if_sheet_exists="replace", engine="openpyxl"
-    ) as writer:
-        updated_df.to_excel(writer, sheet_name="pastDownloads", index=False)
+
+# --------------------------------- past_download_key ---------------------------------
+def past_download_key(title, uploader):
+    """Normalized (title, uploader) pair pastDownloads entries are matched on."""
+    return (str(title).strip().lower(), str(uploader).strip().lower())
+
+
+# --------------------------------- PastDownloadsIndex ---------------------------------
+class PastDownloadsIndex:
+    """In-memory set of normalized (title, uploader) keys from the pastDownloads sheet.
+
+    Built once per run so duplicate checks are O(1) instead of a sheet read per row;
+    call `add` as downloads complete to keep it in step with the sheet.
+    """
+
+    def __init__(self, keys=None):
+        self._keys = set(keys or ())
+
+    _key = staticmethod(past_download_key)
+
+    @classmethod
+    def from_workbook(cls, book):
+        """Index the pastDownloads sheet of an open ExcelWorkbookController."""
+        return cls(
+            cls._key(title, uploader)
+            for title, uploader in book.read_rows("pastDownloads", ("Title", "Uploader"))
+            if title is not None and uploader is not None
+        )
+
+    def contains(self, title, uploader):
+        return self._key(title, uploader) in self._keys
+
+    def add(self, title, uploader):
+        self._keys.add(self._key(title, uploader))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __iter__(self):
+        """Normalized (title, uploader) pairs."""
+        return iter(list(self._keys))
+
+
+# --------------------------------- LedgerWriter ---------------------------------
+class LedgerWriter:
+    """Records pastDownloads / failedDownloads appends and red row highlights.
+
+    Entries go straight into `book` (an ExcelWorkbookController), in memory;
+    a save of the book is asked for every `flush_every` entries, at the latest
+    `flush_interval` seconds after the last one (by a timer, so an entry
+    never waits for the next add), or on `close()`. Use it as a context
+    manager so the final flush runs on errors and Ctrl-C too. failedDownloads
+    keeps one row per URL (see record_failure); run compact_failures on the
+    book first if it may come from an older sheet. The rows of failed URLs
+    are colored red in
+    `sheet_name` of the same book, all at once per flush; pass `url_rows`
+    ({url: row number} of that sheet) if the caller already has them,
+    otherwise the sheet is scanned once for them.
+
+    `on_flush(past_urls, failed_urls, seconds)` is called once a save has put
+    those URLs on disk (the book may coalesce saves, so possibly later, from
+    another thread), with how long the save took.
+
+    With `book=None` nothing is written anywhere; entries are only batched
+    and reported to `on_flush`, for runs that don't keep an Excel ledger.
+    """
+
+    def __init__(self, book, sheet_name, flush_every=None, flush_interval=None, on_flush=None,
+                 url_rows=None):
+        self.book = book
+        self.sheet_name = sheet_name
+        if book is not None and sheet_name and url_rows is not None:
+            book.set_url_rows(sheet_name, url_rows)
+        self.on_flush = on_flush
+        self.flush_every = flush_every or get_config("ledger", "flush_every", 25)
+        self.flush_interval = flush_interval or get_config("ledger", "flush_interval", 60)
+        self._lock = threading.RLock()
+        self._past_urls = []
+        self._failed_urls = []
+        self._last_flush = time.monotonic()
+        self._timer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self._past_urls) + len(self._failed_urls)
+
+    def add_past_download(self, url, title, uploader):
+        with self._lock:
+            if self.book is not None:
+                self.book.append_rows("pastDownloads", _PAST_COLUMNS, [[
+                    datetime.date.today().strftime("%m/%d/%Y"), url, title, uploader,
+                ]])
+            self._past_urls.append(url)
+            self._maybe_flush()
+
+    def add_failed_download(self, url, reason, error_class=None):
+        with self._lock:
+            if self.book is not None:
+                record_failure(self.book, url, reason, error_class)
+            self._failed_urls.append(url)
+            self._maybe_flush()
+
+    def _maybe_flush(self):
+        wait = self._last_flush + self.flush_interval - time.monotonic()
+        if len(self) >= self.flush_every or wait <= 0:
+            self.flush()
+        elif self._timer is None:
+            self._timer = threading.Timer(wait, self._timed_flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _timed_flush(self):
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Could not flush the ledger: {e}")
+
+    def flush(self, force=False):
+        """Save everything recorded since the last flush; returns False if the save failed.
+
+        On `close()` (`force=True`) the save is made right away; otherwise the
+        book may fold it into one made a little later.
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not len(self) and not force:
+                return True
+            past_urls, failed_urls = self._past_urls, self._failed_urls
+            self._past_urls, self._failed_urls = [], []
+            self._last_flush = time.monotonic()
+
+            def saved(seconds, size):
+                if self.on_flush:
+                    self.on_flush(past_urls, failed_urls, seconds)
+
+            if self.book is None:
+                saved(0.0, 0)
+                return True
+            try:
+                self.book.highlight_urls(self.sheet_name, failed_urls)
+                self.book.save_workbook(force=force, on_saved=saved)
+            except Exception as e:
+                # The entries stay in the book and `saved` stays queued, so the
+                # next save reports them (e.g. once the file is closed in Excel)
+                logger.error(f"Could not write ledger to {self.book.file_path}: {e}")
+                return False
+            return True
+
+    def close(self):
+        self.flush(force=True)
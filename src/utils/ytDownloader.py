@@ -1,7 +1,15 @@
+import glob
+import itertools
+import multiprocessing
 import os
 import re
 import shutil
+import signal
 import subprocess
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import nullcontext
 
 from rich.progress import (
     BarColumn,
@@ -10,12 +18,26 @@ from rich.progress import (
     TextColumn,
     TimeRemainingColumn,
 )
-from yt_dlp.postprocessor import MetadataParserPP
+from yt_dlp.postprocessor import (
+    EmbedThumbnailPP,
+    FFmpegExtractAudioPP,
+    FFmpegMetadataPP,
+    FFmpegPostProcessor,
+    MetadataParserPP,
+)
+from yt_dlp.utils import PlaylistEntries
 import yt_dlp
-from src.config import get_logger
+from src.config import get_config, get_logger
+
+try:
+    import resource
+except ImportError:  # Windows; CPU time is then not reported
+    resource = None
 
 # Utils
+from src.utils.infoCache import CACHED_KEY
 from src.utils.metadata import clean_keywords
+from src.utils.thumbnailCache import ThumbnailCachePP
 
 logger = get_logger(__name__)
 
@@ -88,120 +110,611 @@ def search_youtube_url(artist, title):
         return None
 
 
-# --------------------------------- downloadFile ---------------------------------
-def download_file(outtmpl, url, metadata=None):
-    post_args = [
-        "-c:v",
-        "mjpeg",
-        "-vf",
-        "crop='if(gt(ih,iw),iw,ih)':'if(gt(iw,ih),ih,iw)'",
-    ]
-
-    # Add metadata override arguments
-    if metadata:
-        if metadata.get("title"):
-            cleaned_title = clean_keywords(metadata["title"])
-            post_args += ["-metadata", f"title={cleaned_title}"]
-        if metadata.get("artist"):
-            cleaned_artist = clean_keywords(metadata["artist"])
-            post_args += ["-metadata", f"artist={cleaned_artist}"]
-
-    # Maps yt-dlp postprocessor class names to (start%, end%, label)
-    _PP_SLOTS = {
-        "FixupM4a":           (80.0,  85.0, "Fixing container"),
-        "FFmpegExtractAudio": (85.0,  90.0, "Extracting audio"),
-        "FFmpegMetadata":     (90.0,  95.0, "Writing metadata"),
-        "EmbedThumbnail":     (95.0, 100.0, "Embedding thumbnail"),
-    }
-    _bitrate = [None]
-
-    progress = Progress(
+# --------------------------------- _make_progress ---------------------------------
+# Bar layout shared by single-track downloads and the concurrent run display
+def _progress_columns():
+    return (
         TextColumn("  "),
         BarColumn(bar_width=40, complete_style="green", finished_style="green"),
         TaskProgressColumn(),
         TextColumn("[cyan]{task.fields[speed]}[/cyan]"),
         TimeRemainingColumn(),
         TextColumn("[dim]{task.description}[/dim]"),
-        transient=False,
-        refresh_per_second=10,
     )
-    task_id = progress.add_task("Downloading", total=100.0, speed="")
 
-    def _on_progress(d):
+
+def _make_progress():
+    return Progress(*_progress_columns(), transient=False, refresh_per_second=10)
+
+
+# --------------------------------- RunProgress ---------------------------------
+class RunProgress(Progress):
+    """The one live display of a download run: an overall bar plus a row per active track.
+
+    Pass it as `progress` to `DownloadSession.download`; call `queued` as URLs
+    are handed out and `track_done` as each one is finished with, whatever
+    the outcome. The overall total grows as playlists are expanded.
+    """
+
+    def __init__(self):
+        super().__init__(*_progress_columns(), transient=False, refresh_per_second=5)
+        self._counts_lock = threading.Lock()
+        self._queued = 0
+        self._done = 0
+        self._overall = self.add_task("All tracks", total=None, speed="")
+
+    def _update_overall(self):
+        self.update(
+            self._overall, total=self._queued, completed=self._done,
+            description=f"All tracks ({self._done}/{self._queued})",
+        )
+
+    def queued(self):
+        with self._counts_lock:
+            self._queued += 1
+            self._update_overall()
+
+    def track_done(self):
+        with self._counts_lock:
+            self._done += 1
+            self._update_overall()
+
+
+# Maps yt-dlp postprocessor keys (class name minus "FFmpeg"/"PP") to (start%, end%, label)
+_PP_SLOTS = {
+    "FixupM4a":           (80.0,  85.0, "Fixing container"),
+    "ExtractAudio":       (85.0,  90.0, "Extracting audio"),
+    "Metadata":           (90.0,  93.0, "Writing metadata"),
+    "ThumbnailCache":     (93.0,  95.0, "Preparing cover"),
+    "EmbedThumbnail":     (95.0, 100.0, "Embedding thumbnail"),
+}
+
+
+# --------------------------------- _StageClock ---------------------------------
+# - Seconds each postprocessor took, from its started/finished hook events
+class _StageClock:
+    def __init__(self):
+        self._started = {}
+        self.durations = {}
+
+    def on_postprocessor(self, d):
+        pp, status = d.get("postprocessor"), d.get("status")
+        if status == "started":
+            self._started[pp] = time.perf_counter()
+        elif status == "finished" and pp in self._started:
+            elapsed = time.perf_counter() - self._started.pop(pp)
+            self.durations[pp] = self.durations.get(pp, 0.0) + elapsed
+
+
+# --------------------------------- _TrackProgress ---------------------------------
+# Minimum seconds between two redraws of one track's download row
+_UPDATE_INTERVAL = 0.25
+
+
+def _format_bytes(n):
+    for unit in ("B", "KiB", "MiB"):
+        if n < 1024:
+            return f"{n:.1f}{unit}"
+        n /= 1024
+    return f"{n:.1f}GiB"
+
+
+# - Progress bar for one track, driven by yt-dlp's progress/postprocessor hooks
+# - With a shared `progress` the track gets its own row in it, labelled with the
+#   track name, and the row is removed once the track is done
+class _TrackProgress:
+    def __init__(self, name, progress=None, on_downloaded=None):
+        self.on_downloaded = on_downloaded
+        self.shared = progress is not None
+        self.progress = progress if self.shared else _make_progress()
+        self.label_prefix = f"{name} | " if self.shared else ""
+        self.bitrate = None
+        # Size and network time of the finished download, for throughput stats
+        self.bytes = None
+        self.elapsed = None
+        # Postprocessor timings when they run in this process
+        self.clock = _StageClock()
+        self._last_update = 0.0
+        # Postprocessor events come from the pool's listener thread and may
+        # arrive after stop() has removed the task
+        self._lock = threading.Lock()
+        self._stopped = False
+        self.task_id = self.progress.add_task(self.label_prefix + "Downloading", total=100.0, speed="")
+
+    def start(self):
+        if not self.shared:
+            self.progress.start()
+
+    def stop(self):
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+            if self.shared:
+                self.progress.remove_task(self.task_id)
+            else:
+                self.progress.stop()
+
+    def on_progress(self, d):
         status = d.get("status")
         if status == "downloading":
-            frag_idx = d.get("fragment_index")
-            frag_cnt = d.get("fragment_count")
-            if frag_idx is not None and frag_cnt:
-                dl_pct = frag_idx / frag_cnt * 100
+            now = time.monotonic()
+            if now - self._last_update < _UPDATE_INTERVAL:
+                return
+            self._last_update = now
+            done = d.get("downloaded_bytes") or 0
+            total = d.get("total_bytes") or d.get("total_bytes_estimate")
+            if total:
+                dl_pct = min(100.0, done / total * 100)
+            elif d.get("fragment_count"):
+                dl_pct = (d.get("fragment_index") or 0) / d["fragment_count"] * 100
             else:
-                try:
-                    dl_pct = float(d.get("_percent_str", "0%").strip().rstrip("%"))
-                except (ValueError, AttributeError):
-                    return
-            speed = d.get("_speed_str", "").strip()
-            eta = d.get("_eta_str", "").strip()
-            suffix = f"{speed}  eta {eta}" if speed else ""
-            progress.update(task_id, completed=dl_pct * 0.80, speed=suffix, description="Downloading")
+                return
+            speed = d.get("speed")
+            eta = d.get("eta")
+            suffix = f"{_format_bytes(speed)}/s" if speed else ""
+            if suffix and eta is not None:
+                suffix += f"  eta {int(eta) // 60}:{int(eta) % 60:02d}"
+            self.progress.update(self.task_id, completed=dl_pct * 0.80, speed=suffix, description=self.label_prefix + "Downloading")
         elif status == "finished":
             info = d.get("info_dict", {})
-            _bitrate[0] = info.get("abr") or info.get("tbr")
-            progress.update(task_id, completed=80.0, speed="", description="Post-processing...")
+            self.bitrate = info.get("abr") or info.get("tbr")
+            self.bytes = d.get("total_bytes") or d.get("downloaded_bytes")
+            self.elapsed = d.get("elapsed")
+            self.progress.update(self.task_id, completed=80.0, speed="", description=self.label_prefix + "Post-processing...")
+            if self.on_downloaded:
+                self.on_downloaded()
+                self.on_downloaded = None
 
-    def _on_postprocessor(d):
+    def on_postprocessor(self, d):
+        self.clock.on_postprocessor(d)
         pp = d.get("postprocessor", "")
         pp_status = d.get("status")
         slot = _PP_SLOTS.get(pp)
         if slot is None:
             return
         start_pct, end_pct, label = slot
-        if pp_status == "started":
-            progress.update(task_id, completed=start_pct, description=label + "...")
-        elif pp_status == "finished":
-            progress.update(task_id, completed=end_pct)
-            if end_pct >= 100.0:
-                progress.update(task_id, description="Done!")
-
-    ydl_opts = {
-        "format": "bestaudio/best",
-        "extractaudio": True,
-        "outtmpl": outtmpl,
-        **({"js_runtimes": {_JS_RUNTIME: {}}} if _JS_RUNTIME else {}),
-        "remote_components": ["ejs:github"],
-        "writethumbnail": True,
-        "postprocessors": [
-            {"key": "FFmpegExtractAudio", "preferredcodec": "m4a"},
-            {"key": "FFmpegMetadata", "add_metadata": True},
-            {"key": "EmbedThumbnail"},
-            {
-                "key": "MetadataParser",
-                "when": "pre_process",
-                "actions": [
-                    (
-                        MetadataParserPP.Actions.INTERPRET,
-                        "%(description,webpage_url).4s",
-                        "(?P<meta_comment>)",
-                    ),
-                    (
-                        MetadataParserPP.Actions.INTERPRET,
-                        "%(upload_date,release_year).4s",
-                        "(?P<meta_date>.+)",
-                    ),
-                ],
-            },
+        with self._lock:
+            if self._stopped:
+                return
+            if pp_status == "started":
+                self.progress.update(self.task_id, completed=start_pct, description=self.label_prefix + label + "...")
+            elif pp_status == "finished":
+                self.progress.update(self.task_id, completed=end_pct)
+                if end_pct >= 100.0:
+                    self.progress.update(self.task_id, description=self.label_prefix + "Done!")
+
+
+# --------------------------------- _post_args ---------------------------------
+# ffmpeg metadata overrides for one track; the cover is cropped by ThumbnailCachePP
+def _post_args(metadata=None):
+    post_args = []
+
+    # Add metadata override arguments
+    if metadata:
+        if metadata.get("title"):
+            cleaned_title = clean_keywords(metadata["title"])
+            post_args += ["-metadata", f"title={cleaned_title}"]
+        if metadata.get("artist"):
+            cleaned_artist = clean_keywords(metadata["artist"])
+            post_args += ["-metadata", f"artist={cleaned_artist}"]
+    return post_args
+
+
+# --------------------------------- _select_audio ---------------------------------
+def _is_aac(fmt):
+    return (fmt.get("acodec") or "").startswith(("mp4a", "aac"))
+
+
+def _select_audio(ctx):
+    """yt-dlp format selector: the best audio stream, but AAC when it's about as good.
+
+    FFmpegExtractAudio only remuxes AAC into m4a, while Opus/Vorbis streams
+    are re-encoded. The best AAC stream wins if its bitrate is within
+    `[audio] aac_tolerance` of the best audio-only stream.
+    """
+    formats = ctx["formats"]
+    audio = [f for f in formats if f.get("vcodec") == "none" and f.get("acodec") != "none"]
+    if not audio:
+        yield from formats[-1:]  # same as the old "/best" fallback
+        return
+
+    # yt-dlp sorts formats worst to best
+    best = audio[-1]
+    aac = [f for f in audio if _is_aac(f)]
+    tolerance = get_config("audio", "aac_tolerance", 0.25)
+    if aac and (aac[-1].get("abr") or 0) >= (best.get("abr") or 0) * (1 - tolerance):
+        best = aac[-1]
+    yield best
+
+
+def _cpu_seconds():
+    # CPU used by finished child processes, i.e. ffmpeg
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _audio_path(info):
+    """"remux" if the downloaded audio is AAC and only changes container, else "transcode"."""
+    return "remux" if _is_aac(info) else "transcode"
+
+
+# Run in the download session before format selection
+_PRE_PROCESSORS = [
+    {
+        "key": "MetadataParser",
+        "when": "pre_process",
+        "actions": [
+            (
+                MetadataParserPP.Actions.INTERPRET,
+                "%(description,webpage_url).4s",
+                "(?P<meta_comment>)",
+            ),
+            (
+                MetadataParserPP.Actions.INTERPRET,
+                "%(upload_date,release_year).4s",
+                "(?P<meta_date>.+)",
+            ),
         ],
+    },
+]
+
+# The ffmpeg chain run on the downloaded file, inline or in a PostProcessPool.
+# Created without a downloader: add_post_processor attaches it, and with it the
+# hooks (passing it here too would register every hook twice).
+def _add_post_processors(ydl):
+    ydl.add_post_processor(FFmpegExtractAudioPP(None, preferredcodec="m4a"))
+    ydl.add_post_processor(FFmpegMetadataPP(None, add_metadata=True))
+    ydl.add_post_processor(ThumbnailCachePP(None))
+    ydl.add_post_processor(EmbedThumbnailPP(None))
+
+
+# --------------------------------- PostProcessPool ---------------------------------
+# Set in each pool worker; carries postprocessor hook events back to the parent
+_pp_events = None
+
+
+def _init_pp_worker(events):
+    global _pp_events
+    _pp_events = events
+    # Ctrl-C is handled by the parent, which lets running jobs finish
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _run_postprocessors(track_id, info, post_args):
+    """Pool worker: run the ffmpeg chain on an already downloaded file.
+
+    Returns the final path, whether the audio was remuxed or transcoded, the
+    CPU seconds ffmpeg spent on it and how long each postprocessor took.
+    """
+    clock = _StageClock()
+
+    def _hook(d):
+        clock.on_postprocessor(d)
+        _pp_events.put((track_id, {"postprocessor": d.get("postprocessor"), "status": d.get("status")}))
+
+    with yt_dlp.YoutubeDL({
         "postprocessor_args": post_args,
         "quiet": True,
         "noprogress": True,
         "logger": YtDlpLogger(logger),
-        "progress_hooks": [_on_progress],
-        "postprocessor_hooks": [_on_postprocessor],
+        "postprocessor_hooks": [_hook],
+    }) as ydl:
+        _add_post_processors(ydl)
+        # Direct file links don't say what they contain; ask ffprobe like ExtractAudio will
+        if info.get("acodec") in (None, "none"):
+            info["acodec"] = FFmpegPostProcessor(ydl).get_audio_codec(info["filepath"])
+        cpu = _cpu_seconds()
+        info = ydl.post_process(info["filepath"], info)
+        if cpu is not None:
+            cpu = _cpu_seconds() - cpu
+    return {
+        "filepath": info["filepath"], "audio": _audio_path(info), "cpu": cpu,
+        "timings": clock.durations,
     }
 
-    with progress:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
 
-    bitrate_str = f" @ {_bitrate[0]:.0f}kbps" if _bitrate[0] else ""
-    name = os.path.basename(outtmpl).replace(".%(ext)s", "")
-    logger.info(f"Successfully downloaded: {name}{bitrate_str}")
+class PostProcessPool:
+    """Process pool that runs the ffmpeg postprocessors off the download path.
+
+    While one track is transcoded and tagged here, the session that downloaded
+    it is already fetching the next one. Hook events from the workers are
+    forwarded to each track's progress bar, so the `_PP_SLOTS` steps still show.
+    `workers` defaults to `[postprocess] workers` in config.toml, or one less
+    than the CPU count.
+    """
+
+    def __init__(self, workers=None):
+        workers = workers or get_config("postprocess", "workers") or max(1, (os.cpu_count() or 2) - 1)
+        self.workers = workers
+        # spawn, not fork: the parent is running threads and a live display
+        ctx = multiprocessing.get_context("spawn")
+        self._events = ctx.Queue()
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers, mp_context=ctx,
+            initializer=_init_pp_worker, initargs=(self._events,),
+        )
+        self._tracks = {}
+        self._ids = itertools.count()
+        self._closed = False
+        self._listener = threading.Thread(target=self._listen, daemon=True)
+        self._listener.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        # On Ctrl-C or an error drop queued jobs; running ones still finish
+        self.close(cancel=exc_type is not None)
+
+    def _listen(self):
+        while True:
+            event = self._events.get()
+            if event is None:
+                return
+            track_id, d = event
+            track = self._tracks.get(track_id)
+            if track:
+                track.on_postprocessor(d)
+
+    def submit(self, info, post_args, track=None):
+        """Queue postprocessing for a downloaded track; returns a Future of the final path."""
+        track_id = next(self._ids)
+        if track:
+            self._tracks[track_id] = track
+        # Only plain data crosses the process boundary; the fixups yt-dlp
+        # attached under "__" keys have already run in the download stage
+        info = yt_dlp.YoutubeDL.sanitize_info(
+            {k: v for k, v in info.items() if not k.startswith("__")}
+        )
+        future = self._pool.submit(_run_postprocessors, track_id, info, post_args)
+        future.add_done_callback(lambda _: self._tracks.pop(track_id, None))
+        return future
+
+    def close(self, cancel=False):
+        if self._closed:
+            return
+        self._closed = True
+        self._pool.shutdown(wait=True, cancel_futures=cancel)
+        self._events.put(None)
+        self._listener.join()
+
+
+# --------------------------------- is_playlist_url ---------------------------------
+# URLs that point at a set/playlist/album rather than a single track. A watch
+# URL carrying a list= parameter still means the one video (see noplaylist).
+_PLAYLIST_RE = re.compile(
+    r"soundcloud\.com/[^/?#]+/sets/"
+    r"|youtube\.com/playlist\?"
+    r"|bandcamp\.com/album/"
+    r"|mixcloud\.com/[^/?#]+/playlists/",
+    re.IGNORECASE,
+)
+
+
+def is_playlist_url(url):
+    return bool(_PLAYLIST_RE.search(str(url)))
+
+
+# yt-dlp protocols downloaded fragment by fragment
+_FRAGMENTED_PROTOCOLS = ("m3u8", "dash", "ism", "f4m")
+
+
+# --------------------------------- DownloadSession ---------------------------------
+class DownloadSession:
+    """A long-lived YoutubeDL used to extract and then download many tracks.
+
+    Extractors, the JS runtime and postprocessors are set up once. `extract`
+    returns the info dict and `download` hands that same dict to
+    `process_ie_result`, so each URL is only resolved once. Per-track settings
+    (output template, metadata overrides, progress bar) are swapped in before
+    each download. A session is not thread-safe; give each worker its own.
+
+    With an InfoCache, `extract` is answered from disk when possible (unless
+    `refresh` is set) and a cached entry is re-extracted only if it is actually
+    downloaded, since its stream URLs will have expired.
+
+    With a PostProcessPool, `download` returns as soon as the raw file is on
+    disk and the ffmpeg steps continue in the pool.
+
+    With a RateLimiter, every request that goes over the network waits for its
+    source's turn; cache hits don't count against it.
+    """
+
+    def __init__(self, cache=None, refresh=False, pp_pool=None, limiter=None):
+        self._cache = cache
+        self._limiter = limiter
+        self._refresh = refresh
+        self._track = None
+        self._flat_ydl = None
+        self._pp_pool = pp_pool
+        self._ydl = yt_dlp.YoutubeDL({
+            "format": _select_audio,
+            "noplaylist": True,
+            "extractaudio": True,
+            **({"js_runtimes": {_JS_RUNTIME: {}}} if _JS_RUNTIME else {}),
+            "remote_components": ["ejs:github"],
+            "writethumbnail": True,
+            "postprocessors": _PRE_PROCESSORS,
+            "postprocessor_args": _post_args(),
+            "quiet": True,
+            "noprogress": True,
+            "logger": YtDlpLogger(logger),
+            "progress_hooks": [self._on_progress],
+            "postprocessor_hooks": [self._on_postprocessor],
+        })
+        # With a pool the ffmpeg chain runs there instead
+        if pp_pool is None:
+            _add_post_processors(self._ydl)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._ydl.close()
+        if self._flat_ydl:
+            self._flat_ydl.close()
+
+    # Hooks are registered once; they forward to whichever track is downloading
+    def _on_progress(self, d):
+        if self._track:
+            self._track.on_progress(d)
+
+    def _on_postprocessor(self, d):
+        if self._track:
+            self._track.on_postprocessor(d)
+
+    def extract(self, url, refresh=False):
+        """Resolve `url` to a yt-dlp info dict without downloading."""
+        if self._cache is None:
+            return self._extract(url)
+        return self._cache.fetch(url, self._extract, refresh=refresh or self._refresh)
+
+    def _extract(self, url):
+        with self._request(url):
+            return self._ydl.extract_info(url, download=False)
+
+    def _request(self, url):
+        return self._limiter.request(url) if self._limiter else nullcontext()
+
+    def iter_playlist(self, url):
+        """Yield the entry URLs of a playlist/set as the extractor pages through it.
+
+        Uses flat extraction, so entries are not resolved here; each one goes
+        through `extract` on its own when it's processed.
+        """
+        if self._flat_ydl is None:
+            self._flat_ydl = yt_dlp.YoutubeDL({
+                "extract_flat": "in_playlist",
+                "lazy_playlist": True,
+                **({"js_runtimes": {_JS_RUNTIME: {}}} if _JS_RUNTIME else {}),
+                "remote_components": ["ejs:github"],
+                "quiet": True,
+                "logger": YtDlpLogger(logger),
+            })
+
+        with self._request(url):
+            info = self._flat_ydl.extract_info(url, download=False, process=False)
+        # Follow redirects (e.g. a short link) until the playlist itself
+        while info.get("_type") in ("url", "url_transparent"):
+            with self._request(info["url"]):
+                info = self._flat_ydl.extract_info(info["url"], download=False, process=False)
+        if info.get("_type") not in ("playlist", "multi_video"):
+            yield info.get("webpage_url") or url
+            return
+
+        logger.info(f"Expanding playlist: {info.get('title') or url}")
+        for _, entry in PlaylistEntries(self._flat_ydl, info).get_requested_items():
+            entry_url = entry and (entry.get("url") or entry.get("webpage_url"))
+            if entry_url:
+                yield entry_url
+
+    def download(self, info, outtmpl, metadata=None, progress=None, on_stage=None, on_timing=None,
+                 concurrent_fragments=None):
+        """Download and post-process a track from an info dict returned by `extract`.
+
+        Returns a Future that completes once post-processing is done; it is
+        already done unless a PostProcessPool is in use. Its result is a dict
+        with the final `filepath`, the `audio` path taken ("remux" or
+        "transcode"), the `cpu` seconds ffmpeg used and the seconds per
+        postprocessor (`timings`). `on_stage("downloaded")` fires once the
+        media is on disk and `on_stage("postprocessed")` once ffmpeg is done
+        with it. `on_timing(stage, seconds, **fields)` gets the network
+        download time (with its `bytes` and effective `fragments`) and then
+        each postprocessor's. `concurrent_fragments` is how many HLS/DASH
+        fragments to fetch at once.
+        """
+        name = os.path.basename(outtmpl).replace(".%(ext)s", "")
+        if info.get(CACHED_KEY):
+            started = time.perf_counter()
+            info = self.extract(info[CACHED_KEY], refresh=True)
+            if on_timing:
+                on_timing("extract_info", time.perf_counter() - started)
+        post_args = _post_args(metadata)
+        self._ydl.params["outtmpl"]["default"] = outtmpl
+        self._ydl.params["postprocessor_args"] = post_args
+        self._ydl.params["concurrent_fragment_downloads"] = concurrent_fragments or 1
+
+        # Same clean-up yt-dlp does before downloading from a saved info JSON
+        info = self._ydl.sanitize_info(info, remove_private_keys=True)
+
+        on_downloaded = (lambda: on_stage("downloaded")) if on_stage else None
+        track = _TrackProgress(name, progress, on_downloaded=on_downloaded)
+        self._track = track
+        track.start()
+        cpu = _cpu_seconds()
+        try:
+            with self._request(info.get("webpage_url", "")):
+                result = self._ydl.process_ie_result(info, download=True)
+        except BaseException:
+            track.stop()
+            raise
+        finally:
+            self._track = None
+        if self._cache is not None and track.bytes and track.elapsed:
+            self._cache.record_throughput(info.get("extractor_key"), track.bytes, track.elapsed)
+        if on_timing and track.elapsed:
+            # Plain HTTP downloads are a single request whatever the setting
+            fragmented = any(p in str(result.get("protocol")) for p in _FRAGMENTED_PROTOCOLS)
+            on_timing(
+                "download", track.elapsed, bytes=track.bytes,
+                fragments=(concurrent_fragments or 1) if fragmented else 1,
+            )
+
+        def _finished(future):
+            track.stop()
+            if future.cancelled() or future.exception():
+                return
+            if on_stage:
+                on_stage("postprocessed")
+            stats = future.result()
+            if on_timing:
+                for pp, seconds in stats["timings"].items():
+                    on_timing(pp, seconds)
+            bitrate_str = f" @ {track.bitrate:.0f}kbps" if track.bitrate else ""
+            cpu_str = f", {stats['cpu']:.1f}s CPU" if stats["cpu"] is not None else ""
+            logger.info(f"Successfully downloaded: {name}{bitrate_str} ({stats['audio']}{cpu_str})")
+
+        # requested_downloads only carries what changed per format (filepath, ...)
+        downloaded = {**result, **(result.get("requested_downloads") or [{}])[0]}
+        downloaded.pop("requested_downloads", None)
+        if self._pp_pool is None:
+            # The ffmpeg chain already ran inside process_ie_result; with several
+            # threads the CPU figure also counts their ffmpeg runs
+            if cpu is not None:
+                cpu = _cpu_seconds() - cpu
+            future = Future()
+            future.set_result({
+                "filepath": downloaded.get("filepath"),
+                "audio": _audio_path(downloaded),
+                "cpu": cpu,
+                "timings": track.clock.durations,
+            })
+        else:
+            future = self._pp_pool.submit(downloaded, post_args, track)
+        future.add_done_callback(_finished)
+        return future
+
+
+# --------------------------------- remove_partial_files ---------------------------------
+# Suffixes yt-dlp leaves behind when a download or postprocessor is cut short
+_PARTIAL_SUFFIXES = (".part", ".ytdl", ".temp", ".jpg", ".jpeg", ".png", ".webp")
+
+
+def remove_partial_files(outtmpl):
+    """Delete .part/.ytdl/thumbnail leftovers for the track written to `outtmpl`."""
+    base = outtmpl.replace(".%(ext)s", "")
+    removed = []
+    for path in glob.glob(glob.escape(base) + ".*"):
+        if path.endswith(_PARTIAL_SUFFIXES) or ".part-Frag" in path or ".temp." in path:
+            try:
+                os.remove(path)
+                removed.append(path)
+            except OSError as e:
+                logger.warning(f"Could not remove partial file {path}: {e}")
+    return removed